@@ -1,25 +1,72 @@
-from flask import Flask, render_template, request, jsonify, session, send_file, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, send_file, send_from_directory, redirect, url_for, g
 import csv
 import os
 import uuid
 import datetime
 import random
 import threading
+import time
+import functools
+import gc
+import contextlib
+import re
+import sys
+import marshal
+import cProfile
+import pstats
 from werkzeug.utils import secure_filename
+from markupsafe import Markup
+import results_reader
+import results_integrity
+import results_journal
+import persistence
 import io
+import gzip
+import json
+import hashlib
+import hmac
+import mimetypes
+import zlib
+import math
 import subprocess
-import base64
-import requests
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus
+    fcntl = None
 
 #Flask
 app = Flask(__name__)
-app.secret_key = 'experience_perception_mots_couleurs_2024'
+app.secret_key = os.environ.get('SECRET_KEY', 'experience_perception_mots_couleurs_2024')
+# Clé de dérivation des graines d'essais (voir session_seed)
+TRIAL_SEED_KEY = os.environ.get('TRIAL_SEED_KEY', app.secret_key)
 
 # Configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 RESULTS_FILE = os.path.join(DATA_DIR, 'results.csv')
 RESULTS_LOCK = threading.Lock()
+RESULTS_LOCK_FILE = os.path.join(DATA_DIR, '.results.lock')  # verrou partagé entre workers gunicorn
+ARCHIVE_DIR = os.path.join(DATA_DIR, 'archive')
+JOURNAL_DIR = os.path.join(DATA_DIR, '.journal')  # opérations groupées en cours (voir results_journal)
+
+# Rétention : les sessions inactives depuis RETENTION_DAYS jours sont archivées (0 = désactivé, par défaut)
+RETENTION_DAYS = float(os.environ.get('RETENTION_DAYS', '0'))
+RETENTION_INTERVAL = int(os.environ.get('RETENTION_INTERVAL_SECONDS', '3600'))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+ASSET_MANIFEST_FILE = os.path.join(STATIC_DIR, 'dist', 'manifest.json')  # produit par build_assets.py
+
+# Contrôle d'admission des routes d'écriture (configurable via l'environnement)
+WRITE_RATE_PER_SECOND = float(os.environ.get('WRITE_RATE_PER_SECOND', '5'))  # jetons rechargés par seconde et par session
+WRITE_BURST = int(os.environ.get('WRITE_BURST', '20'))  # taille du seau de jetons
+WRITE_MAX_CONCURRENT = int(os.environ.get('WRITE_MAX_CONCURRENT', '4'))  # écritures simultanées max., tous workers confondus (0 = pas de plafond)
+WRITE_RETRY_AFTER = int(os.environ.get('WRITE_RETRY_AFTER', '2'))  # secondes
+BATCH_MAX_BYTES = int(os.environ.get('BATCH_MAX_BYTES', str(1024 * 1024)))  # corps d'un lot, avant et après décompression
+PREVIOUS_SESSIONS_KEPT = 4  # sessions précédentes d'un navigateur dont les résultats en attente restent acceptés
+
+# Profilage par échantillonnage (désactivé par défaut, réglable depuis /admin/profile)
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))  # fraction des requêtes profilées (0.01 = 1 %)
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', '5')) / 1000  # période d'échantillonnage des piles
+PROFILE_MAX_STACKS = int(os.environ.get('PROFILE_MAX_STACKS', '2000'))  # piles distinctes conservées par route
 
 # Mots réels français
 REAL_WORDS = [
@@ -41,6 +88,7 @@ FAKE_WORDS = [
 WORDS = REAL_WORDS
 NON_WORDS = FAKE_WORDS
 ALL_STIMULI = WORDS + NON_WORDS
+WORD_SET = frozenset(WORDS)
 DISPLAY_TIME = 50  # ms
 
 SIMILAR_DISTRACTORS = {}
@@ -93,6 +141,16 @@ def is_light_color(hex_color):
     luminance = (0.299 * r + 0.587 * g + 0.114 * b)
     return luminance > 128
 
+def install_results_file(operation):
+    """Crée data/results.csv par une opération du journal, sous le verrou des écritures
+    (replay_journal suppose qu'aucune opération n'est en cours hors du verrou) et seulement
+    s'il est toujours absent : un autre worker a pu le créer entre-temps. Retourne True si créé."""
+    with locked_results():
+        if os.path.exists(RESULTS_FILE):
+            return False
+        operation()
+        return True
+
 def recover_results_from_git():
     """Récupère le fichier results.csv depuis Git si absent localement."""
     if os.path.exists(RESULTS_FILE):
@@ -120,33 +178,93 @@ def recover_results_from_git():
         if result.returncode == 0:
             # Créer le dossier s'il n'existe pas
             os.makedirs(DATA_DIR, exist_ok=True)
-            # Écrire le fichier récupéré
-            with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
-                f.write(result.stdout)
-            print(f"✅ Fichier results.csv récupéré depuis Git ({len(result.stdout)} bytes)")
+            # Écrire le fichier récupéré (remplacement atomique via le journal)
+            if install_results_file(functools.partial(results_journal.write_file, JOURNAL_DIR, RESULTS_FILE, result.stdout.encode('utf-8'))):
+                print(f"✅ Fichier results.csv récupéré depuis Git ({len(result.stdout)} bytes)")
             return
     except Exception as e:
         print(f"ℹ️ Impossible de récupérer results.csv depuis Git: {e}")
     
     try:
-        owner = os.environ.get('GITHUB_OWNER')
-        repo = os.environ.get('GITHUB_REPO')
-        branch = os.environ.get('GITHUB_BRANCH', 'main')
-        token = os.environ.get('GITHUB_TOKEN')
-        if owner and repo and branch:
-            url = f"https://raw.githubusercontent.com/{owner}/{repo}/{branch}/data/results.csv"
-            headers = {}
-            if token:
-                headers['Authorization'] = f"Bearer {token}"
-            resp = requests.get(url, headers=headers, timeout=5)
-            if resp.status_code == 200 and resp.text:
+        backend = persistence.get_backend()
+        if backend is not None:
+            content = backend.fetch('data/results.csv')
+            if content:
                 os.makedirs(DATA_DIR, exist_ok=True)
-                with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
-                    f.write(resp.text)
-                print("✅ Fichier results.csv récupéré via GitHub raw")
+                if install_results_file(functools.partial(results_journal.write_file, JOURNAL_DIR, RESULTS_FILE, content)):
+                    print(f"✅ Fichier results.csv récupéré via le backend {backend.name}")
                 return
     except Exception as e:
-        print(f"ℹ️ Impossible de récupérer results.csv via GitHub raw: {e}")
+        print(f"ℹ️ Impossible de récupérer results.csv via le backend distant: {e}")
+
+ARCHIVE_RECOVERY = {'done': False}  # vrai une fois les archives distantes restaurées
+
+def git_show_bytes(rel_path):
+    """Contenu d'un fichier au commit HEAD du dépôt Git local (None s'il est absent)."""
+    result = subprocess.run(['git', 'show', f'HEAD:{rel_path}'], cwd=BASE_DIR, capture_output=True, timeout=10)
+    return result.stdout if result.returncode == 0 else None
+
+def recover_archives():
+    """Restaure les partitions d'archive absentes localement (disque éphémère) depuis Git,
+    puis depuis le backend distant. Retourne False si une source n'a pas pu être lue entièrement :
+    la rétention ne retire alors aucune ligne du fichier chaud."""
+    complete = True
+    sources = {}  # chemin relatif -> lecture du contenu
+    try:
+        listing = subprocess.run(
+            ['git', 'ls-tree', '-r', '--name-only', 'HEAD', '--', 'data/archive'],
+            cwd=BASE_DIR, capture_output=True, text=True, timeout=10
+        )
+        if listing.returncode == 0:  # sinon : pas de dépôt ou pas de commit
+            for rel_path in listing.stdout.splitlines():
+                sources.setdefault(rel_path, functools.partial(git_show_bytes, rel_path))
+    except Exception as e:
+        print(f"ℹ️ Archives Git non consultées: {e}")
+    try:
+        backend = persistence.get_backend()
+        if backend is not None:
+            for rel_path in backend.list_paths('data/archive/'):
+                sources.setdefault(rel_path, functools.partial(backend.fetch, rel_path))
+    except Exception as e:
+        print(f"⚠️ Liste des archives distantes indisponible: {e}")
+        complete = False
+
+    missing = []
+    for rel_path, read in sorted(sources.items()):
+        path = os.path.normpath(os.path.join(BASE_DIR, rel_path))
+        if not path.endswith('.csv.gz') or not path.startswith(ARCHIVE_DIR + os.sep):
+            continue
+        if not os.path.exists(path):
+            missing.append((path, read))
+    if not missing:
+        return complete
+
+    restored = []
+    with results_journal.Transaction(JOURNAL_DIR) as transaction:
+        for path, read in missing:
+            try:
+                content = read()
+            except Exception as e:
+                print(f"⚠️ Archive non restaurée {os.path.relpath(path, BASE_DIR)}: {e}")
+                content = None
+            if not content or content[:2] != b'\x1f\x8b':  # en-tête gzip
+                complete = False
+                continue
+            with open(transaction.segment(path), 'wb') as f:
+                f.write(content)
+            restored.append(path)
+        if restored:
+            with locked_results():
+                transaction.commit()
+                refresh_archive_keys()
+    print(f"✅ {len(restored)}/{len(missing)} partition(s) d'archive restaurée(s)")
+    return complete
+
+def ensure_results_file():
+    """Vérification rapide pour les requêtes : ne relance init_csv() que si le fichier a disparu.
+    Les migrations et la récupération Git sont faites une seule fois au démarrage (create_app)."""
+    if not os.path.exists(RESULTS_FILE):
+        init_csv()
 
 def init_csv():
     """Initialise le fichier CSV avec les en-têtes si il n'existe pas."""
@@ -156,8 +274,8 @@ def init_csv():
     try:
         legacy_path = os.path.join(BASE_DIR, 'results.csv')
         if not os.path.exists(RESULTS_FILE) and os.path.exists(legacy_path):
-            os.replace(legacy_path, RESULTS_FILE)
-            print("ℹ️ Fichier results.csv migré vers data/results.csv")
+            if install_results_file(functools.partial(results_journal.move_file, JOURNAL_DIR, legacy_path, RESULTS_FILE)):
+                print("ℹ️ Fichier results.csv migré vers data/results.csv")
     except Exception as _e:
         pass
     
@@ -165,13 +283,13 @@ def init_csv():
     try:
         legacy_exp_path = os.path.join(DATA_DIR, 'experience_results.csv')
         if not os.path.exists(RESULTS_FILE) and os.path.exists(legacy_exp_path):
-            os.replace(legacy_exp_path, RESULTS_FILE)
-            print("ℹ️ Fichier experience_results.csv migré vers data/results.csv")
-            # Committer la migration pour persister côté Git si auto-commit actif
-            try:
-                commit_results_async("Migrate experience_results.csv to data/results.csv", force_commit=True)
-            except Exception:
-                pass
+            if install_results_file(functools.partial(results_journal.move_file, JOURNAL_DIR, legacy_exp_path, RESULTS_FILE)):
+                print("ℹ️ Fichier experience_results.csv migré vers data/results.csv")
+                # Committer la migration pour persister côté Git si auto-commit actif
+                try:
+                    commit_results_async("Migrate experience_results.csv to data/results.csv", force_commit=True)
+                except Exception:
+                    pass
     except Exception as _e:
         pass
     
@@ -181,50 +299,160 @@ def init_csv():
     
     # Créer le fichier s'il n'existe toujours pas
     if not os.path.exists(RESULTS_FILE):
-        with open(RESULTS_FILE, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                'session_id', 'participant_id', 'timestamp', 'trial_number', 'block_type',
-                'stimulus', 'response', 'correct', 'reaction_time', 'text_color', 
-                'background_color', 'is_word', 'choices_presented'
-            ])
-        print(f"✅ Nouveau fichier CSV créé: {RESULTS_FILE}")
+        if install_results_file(functools.partial(results_journal.write_file, JOURNAL_DIR, RESULTS_FILE, encode_result_rows([RESULTS_HEADER]))):
+            print(f"✅ Nouveau fichier CSV créé: {RESULTS_FILE}")
+
+RESULTS_HEADER = [
+    'session_id', 'participant_id', 'timestamp', 'trial_number', 'block_type',
+    'stimulus', 'response', 'correct', 'reaction_time', 'text_color',
+    'background_color', 'is_word', 'choices_presented'
+]
+
+# Index des clés déjà présentes dans le CSV (idempotence des envois par lots)
+RESULT_KEYS = set()
+RESULT_KEYS_STATE = {'offset': 0, 'header': None, 'inode': None}
+# Clés des lignes archivées : un client peut renvoyer une ligne déjà déplacée dans les archives
+ARCHIVE_KEYS = set()
+ARCHIVE_KEYS_PATHS = set()  # partitions déjà lues (immuables)
+
+RESULT_KEY_COLUMNS = ('session_id', 'trial_number', 'stimulus', 'timestamp')
+
+def encode_result_rows(rows):
+    """Lignes CSV encodées telles qu'écrites dans le fichier de résultats."""
+    buffer = io.StringIO(newline='')
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+def result_key(row):
+    """Clé de déduplication d'une ligne de résultat."""
+    return tuple(str(row.get(column, '')) for column in RESULT_KEY_COLUMNS)
+
+def read_archive_keys(path):
+    """Clés de déduplication des lignes d'une partition d'archive."""
+    with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+        return {result_key(row) for row in csv.DictReader(f)}
+
+def refresh_archive_keys():
+    """Ajoute à ARCHIVE_KEYS les clés des partitions pas encore lues. Doit être appelé dans locked_results()."""
+    for path in archive_partitions():
+        if path not in ARCHIVE_KEYS_PATHS:
+            ARCHIVE_KEYS.update(read_archive_keys(path))
+            ARCHIVE_KEYS_PATHS.add(path)
+    return ARCHIVE_KEYS
+
+def refresh_result_keys():
+    """Met à jour l'index des clés en ne lisant que la fin du fichier ajoutée depuis le dernier appel.
+    Les archives sont relues quand le fichier chaud est remplacé (la rétention crée ses partitions
+    en même temps). Doit être appelé dans locked_results()."""
+    if not os.path.exists(RESULTS_FILE):
+        RESULT_KEYS.clear()
+        RESULT_KEYS_STATE.update(offset=0, header=None, inode=None)
+        return RESULT_KEYS
+    # Une ligne incomplète (écriture en cours) sera lue au prochain appel
+    end = results_reader.complete_size(RESULTS_FILE)
+    inode = os.stat(RESULTS_FILE).st_ino
+    if end < RESULT_KEYS_STATE['offset'] or inode != RESULT_KEYS_STATE['inode']:
+        # Fichier remplacé (rétention, réparation, autre worker) ou tronqué : tout relire
+        RESULT_KEYS.clear()
+        RESULT_KEYS_STATE.update(offset=0, header=None, inode=inode)
+        refresh_archive_keys()
+    if end == RESULT_KEYS_STATE['offset']:
+        return RESULT_KEYS
+    if RESULT_KEYS_STATE['header'] is None:
+        header, rows = results_reader.read_rows(RESULTS_FILE, columns=RESULT_KEY_COLUMNS, end=end)
+        RESULT_KEYS_STATE['header'] = header
+    else:
+        rows = results_reader.read_range(RESULTS_FILE, RESULT_KEYS_STATE['header'], RESULT_KEYS_STATE['offset'], end, columns=RESULT_KEY_COLUMNS)
+    RESULT_KEYS.update(rows)
+    RESULT_KEYS_STATE['offset'] = end
+    return RESULT_KEYS
+
+def replay_journal():
+    """Termine les opérations groupées interrompues par un arrêt brutal (voir results_journal).
+    À appeler sous le verrou des écritures : une entrée encore présente a été laissée par un processus arrêté."""
+    replayed = results_journal.replay(JOURNAL_DIR)
+    if replayed:
+        print(f"♻️ Journal: {replayed} opération(s) interrompue(s) terminée(s)")
+        if os.path.exists(RESULTS_FILE):
+            results_integrity.update_checksums(RESULTS_FILE)
+    return replayed
+
+RESULTS_LOCK_DEPTH = threading.local()  # imbrication de locked_results() dans le thread courant
+
+@contextlib.contextmanager
+def locked_results():
+    """Accès exclusif au fichier de résultats : verrou des threads du processus
+    puis verrou fichier (flock) partagé avec les autres workers.
+    Les opérations groupées interrompues sont terminées avant de rendre la main.
+    Réentrant : un appel imbriqué (ensure_results_file sous le verrou) ne reprend pas les verrous."""
+    if getattr(RESULTS_LOCK_DEPTH, 'value', 0):
+        RESULTS_LOCK_DEPTH.value += 1
+        try:
+            yield
+        finally:
+            RESULTS_LOCK_DEPTH.value -= 1
+        return
+    with RESULTS_LOCK:
+        lock_file = None
+        if fcntl is not None:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            lock_file = open(RESULTS_LOCK_FILE, 'a')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        RESULTS_LOCK_DEPTH.value = 1
+        try:
+            replay_journal()
+            yield
+        finally:
+            RESULTS_LOCK_DEPTH.value = 0
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+def build_result_row(session_id, participant_id, trial_data):
+    """Construit la ligne CSV d'un résultat."""
+    # Gérer les choix (peut être une liste ou None)
+    choices_str = ''
+    if 'choices' in trial_data and trial_data['choices']:
+        if isinstance(trial_data['choices'], list):
+            choices_str = '|'.join(trial_data['choices'])
+        else:
+            choices_str = str(trial_data['choices'])
+
+    return [
+        session_id,
+        participant_id,
+        trial_data.get('timestamp', datetime.datetime.now().isoformat()),
+        trial_data.get('trial_number', ''),
+        trial_data.get('block_type', ''),
+        trial_data.get('stimulus', ''),
+        trial_data.get('response', ''),
+        trial_data.get('correct', False),
+        trial_data.get('reaction_time', 0),
+        trial_data.get('text_color', '#000000'),
+        trial_data.get('background_color', '#ffffff'),
+        trial_data.get('is_word', False),
+        choices_str
+    ]
+
+def append_results(rows):
+    """Ajoute des lignes au fichier CSV en une seule écriture. Doit être appelé dans locked_results()."""
+    # S'assurer que le fichier existe
+    ensure_results_file()
+
+    # Une ligne interrompue par un arrêt brutal ne doit pas absorber la première ligne ajoutée
+    results_integrity.terminate_partial_line(RESULTS_FILE)
+    with open(RESULTS_FILE, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    # Sceller les morceaux complétés (sommes de contrôle lues par verify_results)
+    results_integrity.update_checksums(RESULTS_FILE)
 
 def save_result(session_id, participant_id, trial_data):
     """Sauvegarde un résultat dans le fichier CSV de manière thread-safe."""
-    with RESULTS_LOCK:
-        # S'assurer que le fichier existe
-        init_csv()
-        
-        with open(RESULTS_FILE, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            
-            # Gérer les choix (peut être une liste ou None)
-            choices_str = ''
-            if 'choices' in trial_data and trial_data['choices']:
-                if isinstance(trial_data['choices'], list):
-                    choices_str = '|'.join(trial_data['choices'])
-                else:
-                    choices_str = str(trial_data['choices'])
-            
-            writer.writerow([
-                session_id,
-                participant_id,
-                trial_data.get('timestamp', datetime.datetime.now().isoformat()),
-                trial_data.get('trial_number', ''),
-                trial_data.get('block_type', ''),
-                trial_data.get('stimulus', ''),
-                trial_data.get('response', ''),
-                trial_data.get('correct', False),
-                trial_data.get('reaction_time', 0),
-                trial_data.get('text_color', '#000000'),
-                trial_data.get('background_color', '#ffffff'),
-                trial_data.get('is_word', False),
-                choices_str
-            ])
-            f.flush()
-            os.fsync(f.fileno())
-            
+    with locked_results():
+        append_results([build_result_row(session_id, participant_id, trial_data)])
         print(f"✅ Résultat sauvegardé: {participant_id[:8]}... - {trial_data.get('stimulus', 'N/A')} - {trial_data.get('correct', 'N/A')}")
     # Lancer un commit git asynchrone (n'impacte pas la réponse HTTP)
     commit_message = (
@@ -233,69 +461,239 @@ def save_result(session_id, participant_id, trial_data):
     )
     # Sur Render: forcer le push synchrone pour éviter la perte de données lors de la mise en veille
     commit_results_sync(commit_message)
+    maybe_run_retention()
+
+def save_results_batch(rows):
+    """Sauvegarde un lot de lignes de manière idempotente : les lignes déjà présentes sont ignorées.
+    Retourne (ajoutées, doublons)."""
+    with locked_results():
+        ensure_results_file()
+        known_keys = refresh_result_keys()
+        new_rows = []
+        duplicates = 0
+        for row in rows:
+            key = result_key(dict(zip(RESULTS_HEADER, row)))
+            if key in known_keys or key in ARCHIVE_KEYS:
+                duplicates += 1
+                continue
+            known_keys.add(key)
+            new_rows.append(row)
+        if new_rows:
+            append_results(new_rows)
+    if new_rows:
+        print(f"✅ Lot sauvegardé: {len(new_rows)} ajout(s), {duplicates} doublon(s) ignoré(s)")
+        commit_results_sync(f"Add {len(new_rows)} results (batch)")
+        maybe_run_retention()
+    return len(new_rows), duplicates
+
+DATE_PREFIX = re.compile(r'^\d{4}-\d{2}-\d{2}')
+RETENTION_STATE = {'last_run': 0.0, 'running': False}
+
+def archive_partitions(date_from=None, date_to=None):
+    """Fichiers d'archive, éventuellement élagués par date (AAAA-MM-JJ inclusives)."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    paths = []
+    for date_dir in sorted(os.listdir(ARCHIVE_DIR)):
+        date = date_dir.partition('=')[2]
+        if not date or (date_from and date < date_from) or (date_to and date > date_to):
+            continue
+        for block_dir in sorted(os.listdir(os.path.join(ARCHIVE_DIR, date_dir))):
+            block_path = os.path.join(ARCHIVE_DIR, date_dir, block_dir)
+            paths.extend(os.path.join(block_path, name) for name in sorted(os.listdir(block_path)) if name.endswith('.csv.gz'))
+    return paths
+
+def iter_results(date_from=None, date_to=None):
+    """Parcourt les résultats de toutes les couches (archives puis fichier chaud) sous forme de dicts.
+    Les partitions d'archive hors de l'intervalle de dates ne sont pas ouvertes."""
+    filtered = bool(date_from or date_to)
+    for path in archive_partitions(date_from, date_to):
+        with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+    if os.path.exists(RESULTS_FILE):
+        header, rows = results_reader.read_rows(RESULTS_FILE)
+        for values in rows:
+            row = dict(zip(header, values))
+            if filtered:
+                date = row.get('timestamp', '')[:10]
+                if (date_from and date < date_from) or (date_to and date > date_to):
+                    continue
+            yield row
+
+ARCHIVE_ROW_COUNTS = {}  # chemin -> nombre de lignes (les partitions sont immuables)
 
-def commit_results_sync(message: str = 'Update results.csv', force_commit: bool = False):
+def count_archive_rows(path):
+    """Nombre de lignes de données d'une partition d'archive, compté une seule fois."""
+    if path not in ARCHIVE_ROW_COUNTS:
+        with gzip.open(path, 'rt', newline='', encoding='utf-8') as f:
+            ARCHIVE_ROW_COUNTS[path] = max(0, sum(1 for row in csv.reader(f) if row) - 1)
+    return ARCHIVE_ROW_COUNTS[path]
+
+def archive_stats():
+    """Nombre et taille totale des fichiers d'archive, et nombre de lignes archivées."""
+    paths = archive_partitions()
+    return {
+        'archive_files': len(paths),
+        'archive_bytes': sum(os.path.getsize(p) for p in paths),
+        'archived_entries_count': sum(count_archive_rows(p) for p in paths)
+    }
+
+def write_archive_partition(date, block_type, rows, transaction):
+    """Prépare un nouveau fichier d'archive compressé (immuable) dans `transaction`
+    et retourne le chemin où il sera mis en place."""
+    safe_block = re.sub(r'[^A-Za-z0-9_-]', '_', block_type or 'unknown')
+    directory = os.path.join(ARCHIVE_DIR, f'date={date}', f'block_type={safe_block}')
+    path = os.path.join(directory, f"part-{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.csv.gz")
+    with gzip.open(transaction.segment(path), 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(RESULTS_HEADER)
+        writer.writerows(rows)
+    return path
+
+def run_retention(now=None):
+    """Déplace les lignes des sessions inactives depuis RETENTION_DAYS vers des archives
+    partitionnées par date et type de bloc, et réécrit le fichier chaud avec le reste.
+    Retourne la liste des fichiers d'archive créés."""
+    if RETENTION_DAYS <= 0:
+        return []
+    if not ARCHIVE_RECOVERY['done']:
+        ARCHIVE_RECOVERY['done'] = recover_archives()
+        if not ARCHIVE_RECOVERY['done']:
+            print("⚠️ Rétention reportée: archives distantes non restaurées")
+            return []
+    now = now or datetime.datetime.now()
+    cutoff = (now - datetime.timedelta(days=RETENTION_DAYS)).isoformat()[:19]
+    created = []
+    with locked_results():
+        if not os.path.exists(RESULTS_FILE):
+            return []
+        header, rows = results_reader.read_rows(RESULTS_FILE)
+        records = [dict(zip(header, values)) for values in rows]
+        
+        # Dernière activité de chaque session
+        last_seen = {}
+        for record in records:
+            session_id = record.get('session_id', '')
+            timestamp = record.get('timestamp', '')
+            if timestamp > last_seen.get(session_id, ''):
+                last_seen[session_id] = timestamp
+        completed = {
+            session_id for session_id, timestamp in last_seen.items()
+            if DATE_PREFIX.match(timestamp) and timestamp[:19] < cutoff
+        }
+        if not completed:
+            return []
+        
+        partitions = {}
+        hot_rows = []
+        for record in records:
+            normalized = [record.get(h, '') for h in RESULTS_HEADER]
+            timestamp = record.get('timestamp', '')
+            if record.get('session_id', '') in completed and DATE_PREFIX.match(timestamp):
+                partitions.setdefault((timestamp[:10], record.get('block_type', '')), []).append(normalized)
+            else:
+                hot_rows.append(normalized)
+        
+        # Archives et fichier chaud mis en place ensemble : après un arrêt brutal, le journal
+        # termine l'opération et aucune ligne ne se retrouve à la fois archivée et dans le fichier chaud
+        with results_journal.Transaction(JOURNAL_DIR) as transaction:
+            for (date, block_type), partition_rows in sorted(partitions.items()):
+                created.append(write_archive_partition(date, block_type, partition_rows, transaction))
+            with open(transaction.segment(RESULTS_FILE), 'wb') as f:
+                writer = results_integrity.ChecksumWriter(f, RESULTS_HEADER)
+                writer.writerows(hot_rows)
+            transaction.commit()
+        results_integrity.save_checksums(RESULTS_FILE, writer.chunks)
+    
+    archived = len(records) - len(hot_rows)
+    print(f"📦 Rétention: {len(completed)} session(s), {archived} ligne(s) archivée(s) dans {len(created)} fichier(s)")
+    commit_results_sync(f"Archive {len(completed)} completed sessions", extra_paths=created, rewrite=True)
+    return created
+
+def maybe_run_retention():
+    """Lance la rétention en tâche de fond au plus une fois par RETENTION_INTERVAL secondes."""
+    if RETENTION_DAYS <= 0 or RETENTION_STATE['running']:
+        return
+    if time.time() - RETENTION_STATE['last_run'] < RETENTION_INTERVAL:
+        return
+    RETENTION_STATE['running'] = True
+    RETENTION_STATE['last_run'] = time.time()
+
+    def _worker():
+        try:
+            run_retention()
+        except Exception as e:
+            print(f"⚠️ Rétention échouée: {e}")
+        finally:
+            RETENTION_STATE['running'] = False
+
+    threading.Thread(target=_worker, daemon=True).start()
+
+# Anciens noms de colonnes encore présents dans des fichiers importés ou récupérés
+LEGACY_COLUMNS = {'choices': 'choices_presented'}
+RESULTS_AUTO_REPAIR = os.environ.get('RESULTS_AUTO_REPAIR', '1') == '1'
+# Recontrôler au démarrage le CRC de tous les morceaux scellés, pas seulement des nouveaux
+RESULTS_VERIFY_ALL_CHUNKS = os.environ.get('RESULTS_VERIFY_ALL_CHUNKS', '0') == '1'
+
+def verify_results(full=False, all_chunks=RESULTS_VERIFY_ALL_CHUNKS):
+    """Vérifie le fichier de résultats (voir results_integrity.verify). Rapide par défaut :
+    seules la fin non scellée et les sommes des morceaux scellés depuis la dernière vérification sont relues."""
+    ensure_results_file()
+    return results_integrity.verify(RESULTS_FILE, RESULTS_HEADER, RESULT_KEY_COLUMNS, full=full,
+                                    renamed=LEGACY_COLUMNS, all_chunks=all_chunks)
+
+def repair_results():
+    """Répare le fichier de résultats ; les écritures ne sont bloquées que pendant le remplacement final."""
+    ensure_results_file()
+    report = results_integrity.repair(RESULTS_FILE, RESULTS_HEADER, RESULT_KEY_COLUMNS, locked_results, renamed=LEGACY_COLUMNS)
+    print(f"🛠️ Réparation: {report['rows']} ligne(s) conservée(s), {report['removed']} écartée(s) {report['reasons']}")
+    if report['removed'] or report['reasons']:
+        commit_results_sync("Repair results file", force_commit=True, rewrite=True)
+    return report
+
+def check_results_store():
+    """Vérification au démarrage ; répare si nécessaire (RESULTS_AUTO_REPAIR=0 pour seulement signaler)."""
+    report = verify_results()
+    if report['ok']:
+        if report['checksums'] != 'ok':
+            with locked_results():
+                results_integrity.update_checksums(RESULTS_FILE)
+        print(f"✅ Fichier de résultats vérifié ({report['checked_bytes']} octets analysés, {report['sealed_chunks']} morceau(x) scellé(s), {report['seconds']}s)")
+        return report
+    print(f"⚠️ Fichier de résultats incohérent: {json.dumps({k: v for k, v in report.items() if v})}")
+    if RESULTS_AUTO_REPAIR:
+        report['repair'] = repair_results()
+    return report
+
+def commit_results_sync(message: str = 'Update results.csv', force_commit: bool = False, extra_paths=(), rewrite: bool = False):
     """Effectue un git add/commit/push de data/results.csv de manière SYNCHRONE (bloquante).
     Utilisé sur Render pour garantir la persistance avant mise en veille.
+    `extra_paths` : autres fichiers à pousser (archives créées par la rétention).
+    `rewrite` : le fichier a été volontairement raccourci (rétention, réparation) et remplace la version distante.
     Désactivable via AUTO_COMMIT_RESULTS=0 dans l'environnement."""
     if str(os.environ.get('AUTO_COMMIT_RESULTS', '1')).lower() in ('0', 'false', 'no'):
         return
     
     try:
-        rel_path = os.path.relpath(RESULTS_FILE, BASE_DIR)
-        gh_token = os.environ.get('GITHUB_TOKEN')
-        gh_owner = os.environ.get('GITHUB_OWNER')
-        gh_repo = os.environ.get('GITHUB_REPO')
-        gh_branch = os.environ.get('GITHUB_BRANCH', 'main')
+        # Archives d'abord : le fichier chaud distant ne perd ses lignes qu'une fois leurs archives envoyées
+        paths = (*extra_paths, RESULTS_FILE)
+        rel_paths = [os.path.relpath(path, BASE_DIR) for path in paths]
         
-        # Priorité: push via GitHub API (plus fiable sur Render)
-        if gh_token and gh_owner and gh_repo:
-            print(f"ℹ️ Tentative push GitHub API (sync) vers {gh_owner}/{gh_repo}/{gh_branch}")
+        # Priorité: backend distant (API GitHub ou stockage S3, plus fiable sur Render)
+        backend = persistence.get_backend()
+        if backend is not None:
+            print(f"ℹ️ Tentative d'envoi (sync) via le backend {backend.name}")
             try:
-                path = 'data/results.csv'
-                get_url = f"https://api.github.com/repos/{gh_owner}/{gh_repo}/contents/{path}?ref={gh_branch}"
-                put_url = f"https://api.github.com/repos/{gh_owner}/{gh_repo}/contents/{path}"
-                headers = {
-                    'Authorization': f'Bearer {gh_token}',
-                    'Accept': 'application/vnd.github+json'
-                }
-                sha = None
-                r = requests.get(get_url, headers=headers, timeout=10)
-                if r.status_code == 200 and isinstance(r.json(), dict):
-                    sha = r.json().get('sha')
-                    print(f"ℹ️ SHA récupéré: {sha[:8]}...")
-                with open(RESULTS_FILE, 'rb') as rf:
-                    content_b64 = base64.b64encode(rf.read()).decode('ascii')
-                payload = {
-                    'message': message,
-                    'content': content_b64,
-                    'branch': gh_branch,
-                    'committer': {'name': 'Results Bot', 'email': 'results-bot@local'}
-                }
-                if sha:
-                    payload['sha'] = sha
-                pr = requests.put(put_url, headers=headers, json=payload, timeout=20)
-                if pr.status_code in (200, 201):
-                    print(f"✅ Données pushées vers GitHub (sync): {message}")
+                pushed = True
+                for path, rel_path in zip(paths, rel_paths):
+                    pushed = pushed and backend.push(path, rel_path.replace(os.sep, '/'), message,
+                                                     rewrite=rewrite and path == RESULTS_FILE)
+                if pushed:
                     return
-                else:
-                    print(f"⚠️ Premier PUT échoué ({pr.status_code}), retry...")
-                    # Retry: récupérer le SHA et réessayer
-                    r2 = requests.get(get_url, headers=headers, timeout=10)
-                    if r2.status_code == 200 and isinstance(r2.json(), dict):
-                        payload['sha'] = r2.json().get('sha')
-                        pr2 = requests.put(put_url, headers=headers, json=payload, timeout=20)
-                        if pr2.status_code in (200, 201):
-                            print(f"✅ Données pushées vers GitHub (sync, retry): {message}")
-                            return
-                        else:
-                            print(f"⚠️ Push GitHub échoué (sync, retry): {pr2.status_code}")
-                    else:
-                        print(f"⚠️ Récupération SHA échouée (retry): {r2.status_code}")
             except Exception as e:
-                print(f"⚠️ Push GitHub exception (sync): {e}")
+                print(f"⚠️ Envoi distant exception (sync): {e}")
         else:
-            print(f"ℹ️ GitHub API non configuré (token={bool(gh_token)}, owner={bool(gh_owner)}, repo={bool(gh_repo)})")
+            print("ℹ️ Aucun backend de persistance distant configuré")
         
         # Fallback: git push local
         try:
@@ -307,7 +705,7 @@ def commit_results_sync(message: str = 'Update results.csv', force_commit: bool
                 check=True
             )
             subprocess.run(
-                ['git', 'add', rel_path],
+                ['git', 'add', *rel_paths],
                 cwd=BASE_DIR,
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL,
@@ -350,57 +748,15 @@ def commit_results_async(message: str = 'Update results.csv', force_commit: bool
         try:
             rel_path = os.path.relpath(RESULTS_FILE, BASE_DIR)
 
-            # Tentative de push via GitHub API si configuré
+            # Tentative d'envoi via le backend distant si configuré
             auto_push = str(os.environ.get('AUTO_PUSH_RESULTS', '0')).lower() in ('1', 'true', 'yes')
-            gh_token = os.environ.get('GITHUB_TOKEN')
-            gh_owner = os.environ.get('GITHUB_OWNER')
-            gh_repo = os.environ.get('GITHUB_REPO')
-            gh_branch = os.environ.get('GITHUB_BRANCH', 'main')
-            used_github_api = False
-            if auto_push and gh_token and gh_owner and gh_repo:
+            used_remote_backend = False
+            backend = persistence.get_backend() if auto_push else None
+            if backend is not None:
                 try:
-                    path = 'data/results.csv'
-                    get_url = f"https://api.github.com/repos/{gh_owner}/{gh_repo}/contents/{path}?ref={gh_branch}"
-                    put_url = f"https://api.github.com/repos/{gh_owner}/{gh_repo}/contents/{path}"
-                    headers = {
-                        'Authorization': f'Bearer {gh_token}',
-                        'Accept': 'application/vnd.github+json'
-                    }
-                    sha = None
-                    r = requests.get(get_url, headers=headers, timeout=10)
-                    if r.status_code == 200 and isinstance(r.json(), dict):
-                        sha = r.json().get('sha')
-                    with open(RESULTS_FILE, 'rb') as rf:
-                        content_b64 = base64.b64encode(rf.read()).decode('ascii')
-                    payload = {
-                        'message': message,
-                        'content': content_b64,
-                        'branch': gh_branch,
-                        'committer': {'name': 'Results Bot', 'email': 'results-bot@local'}
-                    }
-                    if sha:
-                        payload['sha'] = sha
-                    pr = requests.put(put_url, headers=headers, json=payload, timeout=20)
-                    if pr.status_code in (200, 201):
-                        print("✅ Données pushées vers GitHub")
-                        used_github_api = True
-                    else:
-                        try:
-                            r2 = requests.get(get_url, headers=headers, timeout=10)
-                            if r2.status_code == 200 and isinstance(r2.json(), dict):
-                                payload['sha'] = r2.json().get('sha')
-                                pr2 = requests.put(put_url, headers=headers, json=payload, timeout=20)
-                                if pr2.status_code in (200, 201):
-                                    print("✅ Données pushées vers GitHub")
-                                    used_github_api = True
-                                else:
-                                    print(f"⚠️ Push GitHub échoué: {pr2.status_code}")
-                            else:
-                                print(f"⚠️ Récupération SHA GitHub échouée: {r2.status_code}")
-                        except Exception:
-                            print("⚠️ Retry push GitHub échoué")
+                    used_remote_backend = backend.push(RESULTS_FILE, 'data/results.csv', message)
                 except Exception as e:
-                    print(f"⚠️ Push GitHub exception: {e}")
+                    print(f"⚠️ Envoi distant exception: {e}")
 
             # Commit local via git si repo présent (utile en dev local)
             try:
@@ -429,7 +785,7 @@ def commit_results_async(message: str = 'Update results.csv', force_commit: bool
                 )
                 if commit_proc.returncode == 0:
                     print(f"✅ Commit effectué: {message}")
-                    if auto_push and not used_github_api:
+                    if auto_push and not used_remote_backend:
                         try:
                             subprocess.run(['git', 'pull', '--rebase'], cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10)
                             subprocess.run(['git', 'push'], cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10)
@@ -443,20 +799,17 @@ def commit_results_async(message: str = 'Update results.csv', force_commit: bool
 
     threading.Thread(target=_worker, daemon=True).start()
 
-def get_choices(correct_stimulus, n=4, with_color_word=False):
-    """Génère des choix cohérents : mots avec mots, non-mots avec non-mots."""
-    choices = [correct_stimulus]
-    
+def distractor_candidates(correct_stimulus, with_color_word=False):
+    """Calcule les distracteurs candidats (partie déterministe de get_choices).
+    Retourne (distracteurs prioritaires, stimuli de la même catégorie)."""
     # Déterminer si le stimulus est un mot ou un non-mot
-    is_word = correct_stimulus in WORDS
+    is_word = correct_stimulus in WORD_SET
     
     # Choisir la liste appropriée pour les distracteurs
     if is_word:
         available_stimuli = [w for w in WORDS if w != correct_stimulus]
-        print(f"🔤 Stimulus '{correct_stimulus}' est un MOT - choix parmi les mots")
     else:
         available_stimuli = [w for w in NON_WORDS if w != correct_stimulus]
-        print(f"🔤 Stimulus '{correct_stimulus}' est un NON-MOT - choix parmi les non-mots")
     
     color_names = ["rouge", "vert", "bleu", "violet", "orange", "rose", "magenta", "cyan", "turquoise", "indigo"]
     potential_distractors = []
@@ -501,22 +854,45 @@ def get_choices(correct_stimulus, n=4, with_color_word=False):
             unique_distractors.append(item)
             seen.add(item)
     
+    return tuple(unique_distractors), tuple(available_stimuli)
+
+# Index précalculé au démarrage : (stimulus, avec mots de couleur) -> distracteurs candidats
+DISTRACTOR_INDEX = {}
+
+def build_distractor_index():
+    """Précalcule les distracteurs candidats de chaque stimulus du lexique."""
+    DISTRACTOR_INDEX.clear()
+    for stimulus in ALL_STIMULI:
+        for with_color_word in (False, True):
+            DISTRACTOR_INDEX[(stimulus, with_color_word)] = distractor_candidates(stimulus, with_color_word)
+    return DISTRACTOR_INDEX
+
+def get_choices(correct_stimulus, n=4, with_color_word=False, rng=random):
+    """Génère des choix cohérents : mots avec mots, non-mots avec non-mots.
+    `rng` : flux aléatoire de l'essai (voir trial_rng)."""
+    candidates = DISTRACTOR_INDEX.get((correct_stimulus, with_color_word))
+    if candidates is None:
+        candidates = distractor_candidates(correct_stimulus, with_color_word)
+    unique_distractors, available_stimuli = list(candidates[0]), candidates[1]
+    seen = set(unique_distractors)
+    seen.add(correct_stimulus)
+    
     # Sélectionner exactement n-1 distracteurs (même catégorie)
     if len(unique_distractors) >= n-1:
-        selected_distractors = random.sample(unique_distractors, n-1)
+        selected_distractors = rng.sample(unique_distractors, n-1)
     else:
         selected_distractors = unique_distractors
         # Compléter avec des stimuli aléatoires de la même catégorie
         remaining = [w for w in available_stimuli if w not in seen]
         while len(selected_distractors) < n-1 and remaining:
-            choice = random.choice(remaining)
+            choice = rng.choice(remaining)
             selected_distractors.append(choice)
             remaining.remove(choice)
             seen.add(choice)
     
     # Construire la liste finale
     final_choices = [correct_stimulus] + selected_distractors
-    random.shuffle(final_choices)
+    rng.shuffle(final_choices)
     
     # Vérification critique
     if correct_stimulus not in final_choices:
@@ -524,43 +900,24 @@ def get_choices(correct_stimulus, n=4, with_color_word=False):
     
     return final_choices[:n]
 
-@app.route('/')
-def index():
-    """Page d'accueil de l'expérience."""
-    return render_template('index.html')
+def session_seed(session_id):
+    """Graine des essais d'une session, recalculable à partir de son identifiant (présent dans le CSV)
+    et de TRIAL_SEED_KEY : les essais d'un participant peuvent être rejoués lors d'un audit."""
+    return hmac.new(TRIAL_SEED_KEY.encode('utf-8'), str(session_id).encode('utf-8'), hashlib.sha256).hexdigest()
 
-@app.route('/start_experiment', methods=['POST'])
-def start_experiment():
-    """Démarre une nouvelle session d'expérience."""
-    session['session_id'] = str(uuid.uuid4())
-    session['participant_id'] = str(uuid.uuid4())  # Génération automatique de l'ID participant
-    session['current_block'] = 0
-    session['current_trial'] = 0
-    session['results'] = []
-    
-    return jsonify({
-        'success': True,
-        'session_id': session['session_id'],
-        'participant_id': session['participant_id']  # Retourner l'ID généré
-    })
+def trial_rng(seed, block_type, trial_number):
+    """Flux aléatoire propre à un essai, indépendant de l'ordre des requêtes et des autres sessions."""
+    return random.Random(f'{seed}:{block_type}:{trial_number}')
 
-@app.route('/get_trial', methods=['POST'])
-def get_trial():
-    """Génère un nouvel essai pour l'expérience."""
-    if 'session_id' not in session:
-        return jsonify({'error': 'Session non initialisée'}), 400
-    
-    data = request.json
-    block_type = data.get('block_type', 'bw')  # bw, color, colored_bg
-    trial_number = data.get('trial_number', 1)
-    
+def generate_trial(block_type, rng=random):
+    """Tire le stimulus, les couleurs et les choix d'un essai (utilisé par /get_trial et simulate_trials.py)."""
     # Sélectionner un stimulus
-    stimulus = random.choice(ALL_STIMULI)
+    stimulus = rng.choice(ALL_STIMULI)
     
     # Déterminer les couleurs selon le bloc
     if block_type == 'colored_bg':
         # Choisir d'abord la couleur de fond
-        background_color = random.choice(BACKGROUND_COLORS)
+        background_color = rng.choice(BACKGROUND_COLORS)
         
         # Choisir une couleur de texte différente du fond
         available_text_colors = list(COLORS.values())
@@ -575,12 +932,10 @@ def get_trial():
         if not safe_text_colors:
             text_color = "#000000" if is_light_color(background_color) else "#FFFFFF"
         else:
-            text_color = random.choice(safe_text_colors)
-            
-        print(f"🎨 Bloc 3: Fond {background_color} → Texte {text_color}")
+            text_color = rng.choice(safe_text_colors)
         
     elif block_type == 'color':
-        text_color = random.choice(list(COLORS.values()))
+        text_color = rng.choice(list(COLORS.values()))
         background_color = "#FFFFFF"
     else:  # bw
         text_color = "#000000"
@@ -588,18 +943,437 @@ def get_trial():
     
     # Générer les choix
     with_color = block_type in ['color', 'colored_bg']
-    choices = get_choices(stimulus, n=4, with_color_word=with_color)
+    choices = get_choices(stimulus, n=4, with_color_word=with_color, rng=rng)
     
-    return jsonify({
+    return {
         'stimulus': stimulus,
         'text_color': text_color,
         'background_color': background_color,
         'choices': choices,
-        'display_time': DISPLAY_TIME,
-        'is_word': stimulus in WORDS
+        'is_word': stimulus in WORD_SET
+    }
+
+def replay_trial(session_id, block_type, trial_number):
+    """Reconstitue l'essai servi à une session (audit)."""
+    return generate_trial(block_type, trial_rng(session_seed(session_id), block_type, trial_number))
+
+WRITE_SEMAPHORE = threading.BoundedSemaphore(max(1, WRITE_MAX_CONCURRENT))  # repli sans fcntl (par processus)
+WRITE_SLOTS_DIR = os.path.join(DATA_DIR, '.write_slots')  # un fichier verrou par place d'écriture
+RATE_BUCKETS = {}  # clé client -> [jetons, dernier remplissage]
+RATE_BUCKETS_LOCK = threading.Lock()
+RATE_BUCKETS_MAX = 10000
+ADMISSION_STATS = {'in_flight': 0, 'admitted': 0, 'shed_overload': 0, 'shed_rate_limited': 0}
+
+def count_admission(name, delta=1):
+    """Met à jour un compteur d'admission (exposé dans /csv_status)."""
+    with RATE_BUCKETS_LOCK:
+        ADMISSION_STATS[name] += delta
+
+def take_write_token(client_key):
+    """Consomme un jeton du seau du client. Retourne le délai d'attente conseillé (0 si admis)."""
+    now = time.monotonic()
+    with RATE_BUCKETS_LOCK:
+        bucket = RATE_BUCKETS.get(client_key)
+        if bucket is None:
+            if len(RATE_BUCKETS) >= RATE_BUCKETS_MAX:
+                # Oublier les seaux pleins (clients inactifs) pour borner la mémoire
+                idle = [k for k, (tokens, last) in RATE_BUCKETS.items()
+                        if tokens + (now - last) * WRITE_RATE_PER_SECOND >= WRITE_BURST]
+                for k in idle:
+                    del RATE_BUCKETS[k]
+                if len(RATE_BUCKETS) >= RATE_BUCKETS_MAX:
+                    RATE_BUCKETS.clear()
+            bucket = RATE_BUCKETS[client_key] = [float(WRITE_BURST), now]
+        tokens = min(float(WRITE_BURST), bucket[0] + (now - bucket[1]) * WRITE_RATE_PER_SECOND)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0
+        bucket[0] = tokens
+        return max(1, int((1 - tokens) / WRITE_RATE_PER_SECOND + 0.999)) if WRITE_RATE_PER_SECOND > 0 else WRITE_RETRY_AFTER
+
+def acquire_write_slot():
+    """Réserve une des WRITE_MAX_CONCURRENT places d'écriture partagées par tous les workers :
+    une place est un fichier verrouillé par flock non bloquant, libéré automatiquement si le processus meurt.
+    Retourne la fonction de libération, ou None si toutes les places sont prises.
+    WRITE_MAX_CONCURRENT <= 0 désactive le plafond, comme les autres réglages de la série."""
+    if WRITE_MAX_CONCURRENT <= 0:
+        return lambda: None
+    if fcntl is None:
+        return WRITE_SEMAPHORE.release if WRITE_SEMAPHORE.acquire(blocking=False) else None
+    os.makedirs(WRITE_SLOTS_DIR, exist_ok=True)
+    first = random.randrange(WRITE_MAX_CONCURRENT)  # répartit les essais sur les places
+    for i in range(WRITE_MAX_CONCURRENT):
+        path = os.path.join(WRITE_SLOTS_DIR, f'slot-{(first + i) % WRITE_MAX_CONCURRENT}.lock')
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            continue
+        return functools.partial(os.close, fd)  # fermer le descripteur libère le verrou
+    return None
+
+def write_admission(view):
+    """Décorateur des routes d'écriture : limite par session (seau de jetons) puis plafond global
+    d'écritures simultanées. Rejette immédiatement plutôt que de faire attendre les workers."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        client_key = session.get('session_id') or request.remote_addr or 'unknown'
+        retry_after = take_write_token(client_key)
+        if retry_after:
+            count_admission('shed_rate_limited')
+            response = jsonify({'success': False, 'error': 'Trop de requêtes, réessayez plus tard'})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+
+        release_slot = acquire_write_slot()
+        if release_slot is None:
+            count_admission('shed_overload')
+            print(f"⚠️ Écriture rejetée (surcharge): {request.path}")
+            response = jsonify({'success': False, 'error': 'Serveur surchargé, réessayez plus tard'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(WRITE_RETRY_AFTER)
+            return response
+        count_admission('in_flight')
+        count_admission('admitted')
+        try:
+            return view(*args, **kwargs)
+        finally:
+            count_admission('in_flight', -1)
+            release_slot()
+    return wrapper
+
+def load_asset_manifest():
+    """Charge le manifeste des fichiers statiques empreintés (vide si build_assets.py n'a pas été lancé)."""
+    try:
+        with open(ASSET_MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+ASSET_MANIFEST = {}  # rempli par warm_caches()
+# Change à chaque déploiement modifiant le gabarit ou les fichiers statiques (invalide les ETag du dashboard)
+DASHBOARD_TEMPLATE_VERSION = None
+
+@app.url_defaults
+def hashed_static_url(endpoint, values):
+    """Fait pointer url_for('static', filename=...) vers la version empreintée si elle existe."""
+    if endpoint == 'static' and values.get('filename') in ASSET_MANIFEST:
+        values['filename'] = ASSET_MANIFEST[values['filename']]
+
+@app.before_request
+def serve_precompressed_asset():
+    """Sert la variante .br/.gz pré-compressée d'un fichier empreinté si le client l'accepte."""
+    if not request.path.startswith('/static/dist/'):
+        return None
+    filename = request.path[len('/static/'):]
+    # Qualités analysées par werkzeug : q=0 refuse un encodage, '*' couvre ceux non cités
+    candidates = [
+        (request.accept_encodings.quality(encoding), -rank, encoding, suffix)
+        for rank, (encoding, suffix) in enumerate((('br', '.br'), ('gzip', '.gz')))
+        if os.path.isfile(os.path.join(STATIC_DIR, filename + suffix))
+    ]
+    candidates = [candidate for candidate in candidates if candidate[0] > 0]
+    if not candidates:
+        return None
+    _, _, encoding, suffix = max(candidates)  # qualité la plus haute, br à égalité
+    response = send_from_directory(STATIC_DIR, filename + suffix, mimetype=mimetypes.guess_type(filename)[0])
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@app.after_request
+def static_cache_headers(response):
+    """Les fichiers empreintés ne changent jamais : cache navigateur d'un an."""
+    if request.path.startswith('/static/dist/'):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response.headers.setdefault('Vary', 'Accept-Encoding')
+    return response
+
+def results_file_etag(*extra):
+    """ETag faible dérivé de la taille et de la date de modification du fichier de résultats."""
+    try:
+        stat = os.stat(RESULTS_FILE)
+        parts = [stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        parts = ['absent']
+    parts.extend(extra)
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:16]
+
+def results_file_last_modified():
+    """Date de dernière modification du fichier de résultats (None s'il n'existe pas)."""
+    try:
+        return datetime.datetime.fromtimestamp(int(os.path.getmtime(RESULTS_FILE)), datetime.timezone.utc)
+    except OSError:
+        return None
+
+ENTRY_COUNT_CACHE = {'stamp': None, 'count': 0}
+
+def count_result_entries():
+    """Nombre de lignes de résultats, recompté seulement si le fichier a changé."""
+    stat = os.stat(RESULTS_FILE)
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    if ENTRY_COUNT_CACHE['stamp'] != stamp:
+        ENTRY_COUNT_CACHE.update(stamp=stamp, count=results_reader.count_rows(RESULTS_FILE))
+    return ENTRY_COUNT_CACHE['count']
+
+# Fragments HTML du dashboard, un par participant : {participant_id: (clé de contenu, fragment, agrégats)}
+# Un participant terminé ne reçoit plus de lignes : son fragment et ses agrégats sont réutilisés tels quels.
+PARTICIPANT_FRAGMENTS = {}
+PARTICIPANT_FRAGMENTS_LOCK = threading.Lock()
+# Taille totale des fragments conservés par worker (un participant complet pèse ~100 Ko)
+PARTICIPANT_FRAGMENTS_MAX_BYTES = int(os.environ.get('DASHBOARD_FRAGMENT_CACHE_BYTES', str(32 * 1024 * 1024)))
+PARTICIPANT_FRAGMENTS_SIZE = {'bytes': 0}
+
+def participant_summary(participant):
+    """Ajoute la précision et le temps de réaction moyen d'un participant."""
+    if participant['total_trials'] == 0:
+        participant['accuracy'] = 0
+        return participant
+    participant['accuracy'] = round((participant['correct_trials'] / participant['total_trials']) * 100, 1)
+    
+    # Calculer temps de réaction moyen
+    reaction_times = []
+    for trial in participant['trials']:
+        try:
+            rt = trial.get('reaction_time', '0')
+            if rt and str(rt).replace('.', '').isdigit():
+                reaction_times.append(float(rt))
+        except (ValueError, TypeError):
+            continue
+    
+    participant['avg_reaction_time'] = round(sum(reaction_times) / len(reaction_times), 0) if reaction_times else 0
+    return participant
+
+def results_aggregates(results):
+    """Sommes partielles des statistiques du dashboard :
+    par bloc [essais, corrects, somme des temps, nombre de temps] et par numéro d'essai [somme des temps, nombre].
+    Additionnées par merge_aggregates(), elles donnent les statistiques de tous les participants."""
+    blocks = {}
+    by_trial = {}
+    for result in results:
+        block = blocks.setdefault(result.get('block_type', ''), [0, 0, 0.0, 0])
+        block[0] += 1
+        if str(result.get('correct', '')).lower() == 'true':
+            block[1] += 1
+        rt = str(result.get('reaction_time', '0'))
+        try:
+            value = float(rt)
+        except ValueError:
+            continue
+        if rt.replace('.', '').isdigit():
+            block[2] += value
+            block[3] += 1
+        try:
+            trial_number = int(result.get('trial_number', ''))
+        except ValueError:
+            continue
+        if math.isfinite(value):
+            point = by_trial.setdefault(trial_number, [0.0, 0])
+            point[0] += value
+            point[1] += 1
+    return blocks, by_trial
+
+def merge_aggregates(parts):
+    """Additionne les agrégats de results_aggregates()."""
+    blocks = {}
+    by_trial = {}
+    for part_blocks, part_by_trial in parts:
+        for block_type, values in part_blocks.items():
+            total = blocks.setdefault(block_type, [0, 0, 0.0, 0])
+            for i, value in enumerate(values):
+                total[i] += value
+        for trial_number, (rt_sum, rt_count) in part_by_trial.items():
+            point = by_trial.setdefault(trial_number, [0.0, 0])
+            point[0] += rt_sum
+            point[1] += rt_count
+    return blocks, by_trial
+
+def rt_by_trial(by_trial):
+    """Courbe des temps de réaction moyens par numéro d'essai, pour le graphique du dashboard."""
+    trials = sorted(by_trial)
+    return {'trials': trials, 'avg': [round(by_trial[n][0] / by_trial[n][1]) for n in trials]}
+
+def render_participant_fragments(participants_list):
+    """Fragments HTML et agrégats (results_aggregates) des participants dans l'ordre de la liste.
+    Seuls les participants dont la clé (identifiant, nombre de lignes, dernière ligne, rang) a changé
+    sont recalculés et rendus : le coût suit le nombre de participants actifs."""
+    fragments = []
+    aggregates = []
+    for index, participant in enumerate(participants_list, 1):
+        participant_id = participant['participant_id']
+        trials = participant['trials']
+        key = (participant['total_trials'], participant['first_timestamp'], trials[-1]['timestamp'] if trials else None,
+               index, DASHBOARD_TEMPLATE_VERSION)
+        with PARTICIPANT_FRAGMENTS_LOCK:
+            cached = PARTICIPANT_FRAGMENTS.pop(participant_id, None)
+            if cached is not None:
+                PARTICIPANT_FRAGMENTS_SIZE['bytes'] -= len(cached[1])
+        if cached is None or cached[0] != key:
+            participant_summary(participant)
+            cached = (key, Markup(render_template('admin_participant_row.html', participant=participant, index=index)),
+                      results_aggregates(trials))
+        with PARTICIPANT_FRAGMENTS_LOCK:
+            # Réinsertion en fin de dictionnaire : les moins récemment affichés sont évincés en premier
+            PARTICIPANT_FRAGMENTS[participant_id] = cached
+            PARTICIPANT_FRAGMENTS_SIZE['bytes'] += len(cached[1])
+            while PARTICIPANT_FRAGMENTS_SIZE['bytes'] > PARTICIPANT_FRAGMENTS_MAX_BYTES and PARTICIPANT_FRAGMENTS:
+                PARTICIPANT_FRAGMENTS_SIZE['bytes'] -= len(PARTICIPANT_FRAGMENTS.pop(next(iter(PARTICIPANT_FRAGMENTS)))[1])
+        fragments.append(cached[1])
+        aggregates.append(cached[2])
+    return fragments, aggregates
+
+def date_filter_args():
+    """Filtres de date ?from=AAAA-MM-JJ&to=AAAA-MM-JJ (ignorés s'ils sont mal formés)."""
+    values = []
+    for name in ('from', 'to'):
+        value = request.args.get(name, '')
+        values.append(value[:10] if DATE_PREFIX.match(value) else None)
+    return tuple(values)
+
+def make_conditional_response(response, etag, private=True):
+    """Ajoute ETag/Last-Modified à une réponse et la transforme en 304 si le client est à jour."""
+    response.set_etag(etag, weak=True)
+    response.last_modified = results_file_last_modified()
+    response.headers['Cache-Control'] = ('private' if private else 'public') + ', no-cache'
+    return response.make_conditional(request)
+
+PROFILER_LOCK = threading.Lock()
+PROFILER_WAKE = threading.Event()
+PROFILER_RANDOM = random.Random()  # indépendant du tirage des essais
+PROFILER = {
+    'sample_rate': PROFILE_SAMPLE_RATE,
+    'active': {},      # thread id -> route en cours d'échantillonnage
+    'stacks': {},      # route -> {pile repliée: nombre d'échantillons}
+    'requests': {},    # route -> [requêtes profilées, durée totale (s)]
+    'cprofile': {},    # route -> pstats.Stats cumulées (requêtes marquées)
+    'thread': None,
+}
+
+def format_stack(frame):
+    """Pile d'appels au format replié (racine d'abord, séparée par ';')."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def profiler_loop():
+    """Thread d'échantillonnage : relève périodiquement la pile des seules requêtes tirées au sort."""
+    while True:
+        PROFILER_WAKE.wait()
+        time.sleep(PROFILE_INTERVAL)
+        with PROFILER_LOCK:
+            active = dict(PROFILER['active'])
+            if not active:
+                PROFILER_WAKE.clear()
+                continue
+        frames = sys._current_frames()
+        samples = [(endpoint, format_stack(frames[tid])) for tid, endpoint in active.items() if tid in frames]
+        with PROFILER_LOCK:
+            for endpoint, stack in samples:
+                stacks = PROFILER['stacks'].setdefault(endpoint, {})
+                if stack not in stacks and len(stacks) >= PROFILE_MAX_STACKS:
+                    stack = '[piles tronquées]'
+                stacks[stack] = stacks.get(stack, 0) + 1
+
+def ensure_profiler_thread():
+    """Démarre le thread d'échantillonnage à la première requête profilée."""
+    with PROFILER_LOCK:
+        if PROFILER['thread'] is None:
+            PROFILER['thread'] = threading.Thread(target=profiler_loop, name='profiler', daemon=True)
+            PROFILER['thread'].start()
+
+@app.before_request
+def start_request_profiling():
+    """Profile la requête si elle est tirée au sort, ou avec cProfile si un administrateur la marque
+    (en-tête X-Profile: cprofile ou paramètre ?_profile=cprofile)."""
+    endpoint = request.endpoint
+    if endpoint in (None, 'static', 'admin_profile'):
+        return
+    tagged = 'cprofile' in (request.headers.get('X-Profile', ''), request.args.get('_profile', ''))
+    if tagged and 'admin_authenticated' in session:
+        g.cprofile = cProfile.Profile()
+        g.profile_start = time.perf_counter()
+        g.cprofile.enable()
+    elif PROFILER['sample_rate'] > 0 and PROFILER_RANDOM.random() < PROFILER['sample_rate']:
+        ensure_profiler_thread()
+        g.profile_start = time.perf_counter()
+        with PROFILER_LOCK:
+            PROFILER['active'][threading.get_ident()] = endpoint
+        PROFILER_WAKE.set()
+
+@app.teardown_request
+def stop_request_profiling(exc=None):
+    """Clôt le profilage de la requête et agrège les résultats par route."""
+    if 'profile_start' not in g:
+        return
+    endpoint = request.endpoint
+    duration = time.perf_counter() - g.profile_start
+    profiler = g.pop('cprofile', None)
+    if profiler is not None:
+        profiler.disable()
+    with PROFILER_LOCK:
+        PROFILER['active'].pop(threading.get_ident(), None)
+        totals = PROFILER['requests'].setdefault(endpoint, [0, 0.0])
+        totals[0] += 1
+        totals[1] += duration
+        if profiler is not None:
+            if endpoint in PROFILER['cprofile']:
+                PROFILER['cprofile'][endpoint].add(profiler)
+            else:
+                PROFILER['cprofile'][endpoint] = pstats.Stats(profiler)
+
+@app.route('/')
+def index():
+    """Page d'accueil de l'expérience."""
+    return render_template('index.html')
+
+@app.route('/start_experiment', methods=['POST'])
+def start_experiment():
+    """Démarre une nouvelle session d'expérience."""
+    if session.get('session_id'):
+        # Identifiants précédents de ce navigateur : leurs résultats encore en file d'attente restent acceptés
+        previous = [[session['session_id'], session.get('participant_id', '')]] + session.get('previous_sessions', [])
+        session['previous_sessions'] = previous[:PREVIOUS_SESSIONS_KEPT]
+    session['session_id'] = str(uuid.uuid4())
+    session['participant_id'] = str(uuid.uuid4())  # Génération automatique de l'ID participant
+    session['current_block'] = 0
+    session['current_trial'] = 0
+    session['results'] = []
+    
+    return jsonify({
+        'success': True,
+        'session_id': session['session_id'],
+        'participant_id': session['participant_id']  # Retourner l'ID généré
     })
 
+@app.route('/get_trial', methods=['POST'])
+def get_trial():
+    """Génère un nouvel essai pour l'expérience."""
+    if 'session_id' not in session:
+        return jsonify({'error': 'Session non initialisée'}), 400
+    
+    data = request.json
+    block_type = data.get('block_type', 'bw')  # bw, color, colored_bg
+    trial_number = data.get('trial_number', 1)
+    
+    trial = generate_trial(block_type, trial_rng(session_seed(session['session_id']), block_type, trial_number))
+    if trial['is_word']:
+        print(f"🔤 Stimulus '{trial['stimulus']}' est un MOT - choix parmi les mots")
+    else:
+        print(f"🔤 Stimulus '{trial['stimulus']}' est un NON-MOT - choix parmi les non-mots")
+    if block_type == 'colored_bg':
+        print(f"🎨 Bloc 3: Fond {trial['background_color']} → Texte {trial['text_color']}")
+    
+    trial['display_time'] = DISPLAY_TIME
+    return jsonify(trial)
+
 @app.route('/submit_trial', methods=['POST'])
+@write_admission
 def submit_trial():
     """Soumet un essai et retourne le feedback."""
     data = request.json
@@ -628,6 +1402,7 @@ def submit_trial():
     })
 
 @app.route('/save_result', methods=['POST'])
+@write_admission
 def save_result_endpoint():
     """Sauvegarde un résultat envoyé par le client."""
     try:
@@ -647,7 +1422,7 @@ def save_result_endpoint():
             'reaction_time': data.get('reactionTime', 0),
             'text_color': data.get('textColor', '#000000'),
             'background_color': data.get('backgroundColor', '#ffffff'),
-            'is_word': str(data.get('stimulus', '') in WORDS).lower(),
+            'is_word': str(data.get('stimulus', '') in WORD_SET).lower(),
             'choices': data.get('choices', [])
         }
         
@@ -660,11 +1435,111 @@ def save_result_endpoint():
         print(f"❌ Erreur lors de la sauvegarde: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def is_uuid(value):
+    """Vrai si `value` est un UUID bien formé (identifiants générés par start_experiment)."""
+    try:
+        return str(uuid.UUID(str(value))) == str(value).lower()
+    except ValueError:
+        return False
+
+def read_batch_body():
+    """Corps de /save_results_batch, décompressé si besoin. Retourne None s'il dépasse BATCH_MAX_BYTES
+    (avant ou après décompression : un petit corps gzip peut se décompresser en plusieurs Go)."""
+    if request.content_length is not None and request.content_length > BATCH_MAX_BYTES:
+        return None
+    raw = request.stream.read(BATCH_MAX_BYTES + 1)
+    if len(raw) > BATCH_MAX_BYTES:
+        return None
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        raw = decompressor.decompress(raw, BATCH_MAX_BYTES + 1)
+        if len(raw) > BATCH_MAX_BYTES or decompressor.unconsumed_tail:
+            return None
+        if not decompressor.eof:
+            raise ValueError("Corps gzip incomplet")
+    return raw
+
+def batch_item_ids(item):
+    """(session_id, participant_id) d'un résultat reçu par lot, ou None s'ils sont refusés.
+    Avec une session Flask, ils doivent être ceux de la session (ou d'une session précédente
+    du même navigateur) ; sans session, seuls des UUID bien formés sont acceptés."""
+    session_id = item.get('session_id') or session.get('session_id')
+    participant_id = item.get('participant_id') or session.get('participant_id')
+    if not is_uuid(session_id) or not is_uuid(participant_id):
+        return None
+    if session.get('session_id'):
+        allowed = [[session['session_id'], session.get('participant_id')]] + session.get('previous_sessions', [])
+        if [session_id, participant_id] not in allowed:
+            return None
+    return session_id, participant_id
+
+@app.route('/save_results_batch', methods=['POST'])
+@write_admission
+def save_results_batch_endpoint():
+    """Reçoit un lot de résultats (éventuellement compressé en gzip) depuis la file d'attente du client.
+    Idempotent : un lot renvoyé après un échec réseau ne crée pas de doublons."""
+    try:
+        try:
+            raw = read_batch_body()
+        except (ValueError, zlib.error):
+            return jsonify({'success': False, 'error': 'Corps gzip invalide'}), 400
+        if raw is None:
+            return jsonify({'success': False, 'error': 'Lot trop volumineux'}), 413
+        data = json.loads(raw.decode('utf-8') or '{}')
+        items = data.get('results', []) if isinstance(data, dict) else []
+
+        rows = []
+        accepted_ids = []
+        rejected = 0
+        for item in items:
+            if not isinstance(item, dict) or not item.get('timestamp'):
+                rejected += 1
+                continue
+            ids = batch_item_ids(item)
+            if ids is None:
+                rejected += 1
+                continue
+            session_id, participant_id = ids
+            stimulus = item.get('stimulus', '')
+            trial_data = {
+                'timestamp': item.get('timestamp'),
+                'block_type': item.get('block_type', 'unknown'),
+                'trial_number': item.get('trial_number', 0),
+                'stimulus': stimulus,
+                'response': item.get('response', ''),
+                'correct': item.get('correct', False),
+                'reaction_time': item.get('reaction_time', 0),
+                'text_color': item.get('text_color', '#000000'),
+                'background_color': item.get('background_color', '#ffffff'),
+                'is_word': stimulus in WORD_SET,
+                'choices': item.get('choices', [])
+            }
+            rows.append(build_result_row(session_id, participant_id, trial_data))
+            if item.get('result_id'):
+                accepted_ids.append(item['result_id'])
+
+        saved, duplicates = save_results_batch(rows) if rows else (0, 0)
+        if rejected:
+            print(f"⚠️ Lot: {rejected} résultat(s) refusé(s) (horodatage absent ou identifiants de session invalides)")
+
+        return jsonify({
+            'success': True,
+            'accepted': accepted_ids,
+            'saved': saved,
+            'duplicates': duplicates,
+            'rejected': rejected
+        })
+
+    except Exception as e:
+        print(f"❌ Erreur lors de la sauvegarde du lot: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/test_csv')
+@write_admission
 def test_csv():
     """Route de test pour vérifier la création du CSV."""
     try:
-        init_csv()
+        ensure_results_file()
         
         # Créer un résultat de test
         test_data = {
@@ -718,38 +1593,41 @@ def admin_dashboard():
     imported = request.args.get('imported')
     skipped = request.args.get('skipped')
     import_error = request.args.get('import_error')
-    init_csv()
+    date_from, date_to = date_filter_args()
+    ensure_results_file()
+    
+    # Rien n'a changé depuis le dernier affichage : 304 sans relire le CSV ni rendre le gabarit
+    # (les archives ne changent qu'en réécrivant le fichier chaud, son empreinte suffit)
+    etag = results_file_etag('dashboard', imported, skipped, import_error, date_from, date_to, DASHBOARD_TEMPLATE_VERSION)
+    if request.method == 'GET' and request.if_none_match.contains_weak(etag):
+        return make_conditional_response(app.response_class(), etag)
+    
     if not os.path.exists(RESULTS_FILE):
-        return render_template('admin_dashboard.html', results=[], stats={}, imported=imported, skipped=skipped, import_error=import_error)
+        return render_template('admin_dashboard.html', results_count=0, stats={}, rt_by_trial=rt_by_trial({}), imported=imported, skipped=skipped, import_error=import_error, date_from=date_from, date_to=date_to)
     
-    # Lire tous les résultats avec gestion d'erreur
+    # Lire tous les résultats (archives et fichier chaud) avec gestion d'erreur
     results = []
     try:
-        with open(RESULTS_FILE, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                # S'assurer que toutes les clés nécessaires existent
-                safe_row = {
-                    'participant_id': row.get('participant_id', 'N/A'),
-                    'session_id': row.get('session_id', 'N/A'),
-                    'timestamp': row.get('timestamp', 'N/A'),
-                    'block_type': row.get('block_type', 'unknown'),
-                    'trial_number': row.get('trial_number', 'N/A'),
-                    'stimulus': row.get('stimulus', 'N/A'),
-                    'response': row.get('response', 'N/A'),
-                    'correct': row.get('correct', 'false'),
-                    'reaction_time': row.get('reaction_time', 'N/A'),
-                    'text_color': row.get('text_color', '#000000'),
-                    'background_color': row.get('background_color', '#ffffff'),
-                    'is_word': row.get('is_word', 'false')
-                }
-                results.append(safe_row)
+        for row in iter_results(date_from, date_to):
+            # S'assurer que toutes les clés nécessaires existent
+            safe_row = {
+                'participant_id': row.get('participant_id', 'N/A'),
+                'session_id': row.get('session_id', 'N/A'),
+                'timestamp': row.get('timestamp', 'N/A'),
+                'block_type': row.get('block_type', 'unknown'),
+                'trial_number': row.get('trial_number', 'N/A'),
+                'stimulus': row.get('stimulus', 'N/A'),
+                'response': row.get('response', 'N/A'),
+                'correct': row.get('correct', 'false'),
+                'reaction_time': row.get('reaction_time', 'N/A'),
+                'text_color': row.get('text_color', '#000000'),
+                'background_color': row.get('background_color', '#ffffff'),
+                'is_word': row.get('is_word', 'false')
+            }
+            results.append(safe_row)
     except Exception as e:
         print(f"Erreur lors de la lecture du fichier CSV: {e}")
-        return render_template('admin_dashboard.html', results=[], stats={}, error="Erreur lors de la lecture des données")
-    
-    # Calculer les statistiques par bloc
-    stats = calculate_block_statistics(results)
+        return render_template('admin_dashboard.html', results_count=0, stats={}, rt_by_trial=rt_by_trial({}), error="Erreur lors de la lecture des données")
     
     # Grouper les résultats par participant
     participants = {}
@@ -771,30 +1649,17 @@ def admin_dashboard():
         if str(result['correct']).lower() == 'true':
             participants[participant_id]['correct_trials'] += 1
     
-    # Calculer les statistiques par participant
-    for participant_data in participants.values():
-        if participant_data['total_trials'] > 0:
-            participant_data['accuracy'] = round((participant_data['correct_trials'] / participant_data['total_trials']) * 100, 1)
-            
-            # Calculer temps de réaction moyen
-            reaction_times = []
-            for trial in participant_data['trials']:
-                try:
-                    rt = trial.get('reaction_time', '0')
-                    if rt and str(rt).replace('.', '').isdigit():
-                        reaction_times.append(float(rt))
-                except (ValueError, TypeError):
-                    continue
-            
-            participant_data['avg_reaction_time'] = round(sum(reaction_times) / len(reaction_times), 0) if reaction_times else 0
-        else:
-            participant_data['accuracy'] = 0
-    
     # Convertir en liste et trier par timestamp
     participants_list = list(participants.values())
     participants_list.sort(key=lambda x: x['first_timestamp'])
+    participant_fragments, aggregates = render_participant_fragments(participants_list)
     
-    return render_template('admin_dashboard.html', results=results, stats=stats, participants=participants_list, imported=imported, skipped=skipped, import_error=import_error)
+    # Statistiques par bloc et courbe par essai : sommes des agrégats mis en cache avec les fragments
+    blocks, by_trial = merge_aggregates(aggregates)
+    stats = calculate_block_statistics(blocks)
+    
+    response = app.make_response(render_template('admin_dashboard.html', results_count=len(results), stats=stats, rt_by_trial=rt_by_trial(by_trial), participants=participants_list, participant_fragments=participant_fragments, imported=imported, skipped=skipped, import_error=import_error, date_from=date_from, date_to=date_to))
+    return make_conditional_response(response, etag)
 
 @app.route('/download_results')
 def download_results():
@@ -803,11 +1668,29 @@ def download_results():
         return "Accès non autorisé", 403
     
     # S'assurer que le fichier existe
-    init_csv()
+    ensure_results_file()
     
+    date_from, date_to = date_filter_args()
     if os.path.exists(RESULTS_FILE):
         filename = f'experience_results_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        return send_file(RESULTS_FILE, as_attachment=True, download_name=filename)
+        if not (date_from or date_to or archive_partitions()):
+            response = send_file(RESULTS_FILE, as_attachment=True, download_name=filename, etag=False)
+        else:
+            # Export reconstitué à partir des archives et du fichier chaud
+            def generate():
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(RESULTS_HEADER)
+                for row in iter_results(date_from, date_to):
+                    writer.writerow([row.get(h, '') for h in RESULTS_HEADER])
+                    if buffer.tell() > 64 * 1024:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+                yield buffer.getvalue()
+            response = app.response_class(generate(), mimetype='text/csv')
+            response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        return make_conditional_response(response, results_file_etag('download', date_from, date_to))
     else:
         return "Aucun résultat disponible", 404
 
@@ -815,27 +1698,39 @@ def download_results():
 def csv_status():
     """Vérifie le statut du fichier CSV."""
     try:
-        init_csv()
+        ensure_results_file()
+        admission = {
+            **ADMISSION_STATS,
+            'max_concurrent': WRITE_MAX_CONCURRENT,
+            'rate_per_second': WRITE_RATE_PER_SECOND,
+            'burst': WRITE_BURST
+        }
+        archives = archive_stats()
+        etag = results_file_etag('status', sorted(admission.items()), archives['archive_files'])
+        if request.if_none_match.contains_weak(etag):
+            return make_conditional_response(app.response_class(), etag, private=False)
+        
         file_exists = os.path.exists(RESULTS_FILE)
         file_size = os.path.getsize(RESULTS_FILE) if file_exists else 0
+        hot_entries = count_result_entries() if file_exists else 0
         
-        # Compter les lignes
-        line_count = 0
-        if file_exists:
-            with open(RESULTS_FILE, 'r', encoding='utf-8') as f:
-                line_count = sum(1 for line in f) - 1  # -1 pour l'en-tête
-        
-        return jsonify({
+        response = jsonify({
             'file_exists': file_exists,
             'file_path': os.path.abspath(RESULTS_FILE),
             'file_size': file_size,
-            'entries_count': max(0, line_count),
-            'last_modified': datetime.datetime.fromtimestamp(os.path.getmtime(RESULTS_FILE)).isoformat() if file_exists else None
+            # Toutes les couches : fichier chaud et archives
+            'entries_count': hot_entries + archives['archived_entries_count'],
+            'hot_entries_count': hot_entries,
+            **archives,
+            'last_modified': datetime.datetime.fromtimestamp(os.path.getmtime(RESULTS_FILE)).isoformat() if file_exists else None,
+            'admission': admission
         })
+        return make_conditional_response(response, etag, private=False)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/admin/import_csv', methods=['POST'])
+@write_admission
 def import_results():
     if 'admin_authenticated' not in session:
         return "Accès non autorisé", 403
@@ -845,18 +1740,11 @@ def import_results():
     if not file.filename.lower().endswith('.csv'):
         return redirect(url_for('admin_dashboard', import_error='Format non supporté'))
     try:
-        init_csv()
-        existing_keys = set()
-        with open(RESULTS_FILE, 'r', newline='', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                key = (
-                    row.get('session_id', ''),
-                    row.get('trial_number', ''),
-                    row.get('stimulus', ''),
-                    row.get('timestamp', ''),
-                )
-                existing_keys.add(key)
+        ensure_results_file()
+        _, key_rows = results_reader.read_rows(RESULTS_FILE, columns=RESULT_KEY_COLUMNS)
+        existing_keys = set(key_rows)
+        for path in archive_partitions():
+            existing_keys.update(read_archive_keys(path))
         # Détecter automatiquement le délimiteur (',' ou ';')
         try:
             sample_bytes = file.stream.read(4096)
@@ -870,23 +1758,14 @@ def import_results():
 
         text_stream = io.TextIOWrapper(file.stream, encoding='utf-8', newline='')
         reader = csv.DictReader(text_stream, delimiter=delimiter)
-        header = [
-            'session_id', 'participant_id', 'timestamp', 'trial_number', 'block_type',
-            'stimulus', 'response', 'correct', 'reaction_time', 'text_color',
-            'background_color', 'is_word', 'choices_presented'
-        ]
+        header = RESULTS_HEADER
         imported = 0
         skipped = 0
         rows_to_append = []
         for row in reader:
             if 'choices_presented' not in row and 'choices' in row:
                 row['choices_presented'] = row.get('choices') or ''
-            key = (
-                row.get('session_id', ''),
-                row.get('trial_number', ''),
-                row.get('stimulus', ''),
-                row.get('timestamp', ''),
-            )
+            key = result_key(row)
             if key in existing_keys:
                 skipped += 1
                 continue
@@ -896,10 +1775,11 @@ def import_results():
             imported += 1
 
         if rows_to_append:
-            with RESULTS_LOCK:
-                with open(RESULTS_FILE, 'a', newline='', encoding='utf-8') as f:
-                    writer = csv.writer(f)
-                    writer.writerows(rows_to_append)
+            # Ajout journalisé : une synchronisation pour tout l'import, rejoué s'il est interrompu
+            with locked_results():
+                results_integrity.terminate_partial_line(RESULTS_FILE)
+                results_journal.append_file(JOURNAL_DIR, RESULTS_FILE, encode_result_rows(rows_to_append))
+                results_integrity.update_checksums(RESULTS_FILE)
             # Auto-commit après import si des lignes ont été ajoutées
             commit_results_async(f"Import {imported} results from CSV", force_commit=True)
             print(f"📥 Import terminé: {imported} lignes ajoutées, {skipped} doublons ignorés")
@@ -910,59 +1790,158 @@ def import_results():
     except Exception as e:
         return redirect(url_for('admin_dashboard', import_error=str(e)))
 
-def calculate_block_statistics(results):
-    """Calcule les statistiques par bloc."""
-    stats = {}
-    
+@app.route('/admin/integrity', methods=['GET', 'POST'])
+def admin_integrity():
+    """Vérification du fichier de résultats (accès protégé).
+    GET : rapport rapide, ou complet avec ?full=1 (doublons compris).
+    POST : réparation (lignes écartées conservées dans data/results.rejected.csv)."""
+    if 'admin_authenticated' not in session:
+        return "Accès non autorisé", 403
     try:
-        # Grouper par bloc
-        blocks = {'bw': [], 'color': [], 'colored_bg': []}
-        block_names = {'bw': 'Bloc 1: Noir/Blanc', 'color': 'Bloc 2: Couleurs', 'colored_bg': 'Bloc 3: Fonds colorés'}
-        
-        for result in results:
-            block_type = result.get('block_type', '')
-            if block_type in blocks:
-                blocks[block_type].append(result)
-        
-        # Calculer les stats pour chaque bloc
-        for block_type, block_results in blocks.items():
-            if not block_results:
-                continue
-                
-            # Temps de réaction moyen (avec gestion d'erreurs)
-            reaction_times = []
-            for r in block_results:
+        if request.method == 'POST':
+            return jsonify({'success': True, 'repair': repair_results(), 'report': verify_results(full=True)})
+        full = request.args.get('full', '').lower() in ('1', 'true', 'yes')
+        return jsonify({'success': True, 'report': verify_results(full=full)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    """Profils agrégés par route (accès protégé).
+    GET : résumé JSON, ou ?format=collapsed (piles repliées pour flamegraph.pl/speedscope)
+    ou ?format=pstats&endpoint=... (fichier pstats des requêtes marquées).
+    POST : sample_rate=<0..1> pour régler l'échantillonnage, reset=1 pour vider les données.
+    Les données sont propres à chaque worker gunicorn."""
+    if 'admin_authenticated' not in session:
+        return "Accès non autorisé", 403
+    
+    if request.method == 'POST':
+        params = request.get_json(silent=True) or request.form
+        with PROFILER_LOCK:
+            if 'sample_rate' in params:
                 try:
-                    rt = r.get('reaction_time', '0')
-                    if rt and str(rt).replace('.', '').isdigit():
-                        reaction_times.append(float(rt))
-                except (ValueError, TypeError):
-                    continue
-            
-            avg_reaction_time = sum(reaction_times) / len(reaction_times) if reaction_times else 0
-            
-            # Pourcentage de bonnes réponses
-            correct_answers = [r for r in block_results if str(r.get('correct', '')).lower() == 'true']
-            accuracy = (len(correct_answers) / len(block_results)) * 100 if block_results else 0
-            
-            # Nombre total d'essais
-            total_trials = len(block_results)
-            
-            stats[block_type] = {
-                'name': block_names[block_type],
-                'total_trials': total_trials,
-                'correct_answers': len(correct_answers),
-                'accuracy': round(accuracy, 1),
-                'avg_reaction_time': round(avg_reaction_time, 0)
+                    PROFILER['sample_rate'] = min(1.0, max(0.0, float(params['sample_rate'])))
+                except (TypeError, ValueError):
+                    return jsonify({'success': False, 'error': 'sample_rate invalide'}), 400
+            if str(params.get('reset', '')).lower() in ('1', 'true', 'yes'):
+                PROFILER['stacks'].clear()
+                PROFILER['requests'].clear()
+                PROFILER['cprofile'].clear()
+        print(f"ℹ️ Profilage: taux d'échantillonnage = {PROFILER['sample_rate']}")
+    
+    endpoint = request.args.get('endpoint')
+    output_format = request.args.get('format', 'json')
+    
+    if output_format == 'collapsed':
+        with PROFILER_LOCK:
+            lines = [
+                f"{name};{stack} {count}"
+                for name, stacks in PROFILER['stacks'].items() if endpoint in (None, name)
+                for stack, count in stacks.items()
+            ]
+        return app.response_class('\n'.join(lines) + '\n', mimetype='text/plain')
+    
+    if output_format == 'pstats':
+        with PROFILER_LOCK:
+            stats = PROFILER['cprofile'].get(endpoint)
+            data = marshal.dumps(stats.stats) if stats is not None else None
+        if data is None:
+            return "Aucun profil cProfile pour cette route", 404
+        filename = f'profile_{endpoint}_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.pstats'
+        return send_file(io.BytesIO(data), as_attachment=True, download_name=filename, mimetype='application/octet-stream')
+    
+    with PROFILER_LOCK:
+        summary = {
+            name: {
+                'profiled_requests': count,
+                'avg_duration_ms': round(total / count * 1000, 1) if count else 0,
+                'samples': sum(PROFILER['stacks'].get(name, {}).values()),
+                'distinct_stacks': len(PROFILER['stacks'].get(name, {})),
+                'cprofile': name in PROFILER['cprofile']
             }
+            for name, (count, total) in PROFILER['requests'].items()
+        }
+        return jsonify({
+            'success': True,
+            'sample_rate': PROFILER['sample_rate'],
+            'interval_ms': PROFILE_INTERVAL * 1000,
+            'max_stacks': PROFILE_MAX_STACKS,
+            'endpoints': summary
+        })
+
+def calculate_block_statistics(blocks):
+    """Calcule les statistiques par bloc à partir des sommes de results_aggregates()."""
+    stats = {}
+    block_names = {'bw': 'Bloc 1: Noir/Blanc', 'color': 'Bloc 2: Couleurs', 'colored_bg': 'Bloc 3: Fonds colorés'}
     
-    except Exception as e:
-        print(f"Erreur dans calculate_block_statistics: {e}")
-        # Retourner des stats vides en cas d'erreur
-        stats = {}
+    for block_type, name in block_names.items():
+        if block_type not in blocks:
+            continue
+        total_trials, correct_answers, rt_sum, rt_count = blocks[block_type]
+        
+        # Temps de réaction moyen et pourcentage de bonnes réponses
+        avg_reaction_time = rt_sum / rt_count if rt_count else 0
+        accuracy = (correct_answers / total_trials) * 100 if total_trials else 0
+        
+        stats[block_type] = {
+            'name': name,
+            'total_trials': total_trials,
+            'correct_answers': correct_answers,
+            'accuracy': round(accuracy, 1),
+            'avg_reaction_time': round(avg_reaction_time, 0)
+        }
     
     return stats
 
-if __name__ == '__main__':
+STARTUP = {'done': False, 'phases': {}}
+
+def load_lexicons():
+    """Phase 1 : index précalculés sur les listes de stimuli."""
+    build_distractor_index()
+    print(f"✅ Lexique chargé: {len(ALL_STIMULI)} stimuli, {len(DISTRACTOR_INDEX)} entrées d'index")
+
+def prepare_results_store():
+    """Phase 2 : opérations interrompues, migrations, récupération Git (fichier chaud et archives),
+    vérification du fichier de résultats et rétention."""
+    with locked_results():  # termine les opérations du journal laissées par un arrêt brutal
+        pass
     init_csv()
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    ARCHIVE_RECOVERY['done'] = recover_archives()
+    check_results_store()
+    run_retention()
+    RETENTION_STATE['last_run'] = time.time()
+
+def warm_caches():
+    """Phase 3 : caches lus par les requêtes (manifeste, index des clés, gabarits compilés)."""
+    global DASHBOARD_TEMPLATE_VERSION
+    ASSET_MANIFEST.clear()
+    ASSET_MANIFEST.update(load_asset_manifest())
+    DASHBOARD_TEMPLATE_VERSION = (
+        os.path.getmtime(os.path.join(BASE_DIR, 'templates', 'admin_dashboard.html')),
+        os.path.getmtime(os.path.join(BASE_DIR, 'templates', 'admin_participant_row.html')),
+        tuple(sorted(ASSET_MANIFEST.items()))
+    )
+    with locked_results():
+        refresh_result_keys()
+    if os.path.exists(RESULTS_FILE):
+        count_result_entries()
+    for template in ('index.html', 'admin_login.html', 'admin_dashboard.html', 'admin_participant_row.html'):
+        app.jinja_env.get_template(template)
+
+def create_app():
+    """Prépare l'application une seule fois. Avec `gunicorn --preload 'app:create_app()'`,
+    ce travail est fait dans le processus maître et partagé par copie sur écriture avec les workers."""
+    if STARTUP['done']:
+        return app
+    for name, phase in (('lexicons', load_lexicons), ('data', prepare_results_store), ('caches', warm_caches)):
+        started = time.perf_counter()
+        phase()
+        STARTUP['phases'][name] = round((time.perf_counter() - started) * 1000, 1)
+    # Sortir les objets du démarrage du suivi du GC : les workers ne recopient pas leurs pages
+    gc.freeze()
+    STARTUP['done'] = True
+    print(f"✅ Application prête (phases en ms: {STARTUP['phases']})")
+    return app
+
+if __name__ == '__main__':
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,90 @@
+"""Génère les versions optimisées des fichiers statiques.
+
+Pour chaque fichier listé dans ASSETS :
+- minification légère (commentaires et indentation) ;
+- nom empreinté par le contenu (ex. dist/script.3f2a9c1b04.js) ;
+- versions pré-compressées .gz et .br (si le module brotli est installé).
+
+Le manifeste static/dist/manifest.json est lu par app.py pour que
+url_for('static', filename='script.js') pointe vers la version empreintée.
+
+Usage : python build_assets.py
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:  # Optionnel : seules les versions .gz seront produites
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_FILE = os.path.join(DIST_DIR, 'manifest.json')
+
+ASSETS = ['script.js', 'style.css']
+
+
+def minify_css(text):
+    """Supprime commentaires et espaces superflus d'une feuille de style."""
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """Minification prudente : indentation, lignes vides et commentaires sur ligne entière.
+    Le code n'est pas réécrit, ce qui évite tout risque de casser les gabarits multi-lignes."""
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def build():
+    """Construit static/dist et retourne le manifeste."""
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(DIST_DIR)
+
+    manifest = {}
+    for name in ASSETS:
+        root, ext = os.path.splitext(name)
+        with open(os.path.join(STATIC_DIR, name), 'r', encoding='utf-8') as f:
+            source = f.read()
+        content = MINIFIERS[ext](source).encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()[:10]
+        hashed_name = f'{root}.{digest}{ext}'
+        target = os.path.join(DIST_DIR, hashed_name)
+
+        with open(target, 'wb') as f:
+            f.write(content)
+        with open(target + '.gz', 'wb') as f:
+            f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(target + '.br', 'wb') as f:
+                f.write(brotli.compress(content, quality=11))
+
+        manifest[name] = f'dist/{hashed_name}'
+        print(f"✅ {name} → {manifest[name]} ({len(source.encode('utf-8'))} → {len(content)} octets)")
+
+    with open(MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+if __name__ == '__main__':
+    build()
@@ -0,0 +1,396 @@
+"""Backends de persistance distante des résultats.
+
+Le backend est choisi par la variable PERSISTENCE_BACKEND :
+- 'github' (défaut si GITHUB_OWNER/GITHUB_REPO sont définis, GITHUB_TOKEN requis pour écrire) : API GitHub contents ;
+- 's3' : stockage objet compatible S3 (AWS, MinIO, Ceph...), voir S3Backend ;
+- 'none' : aucun envoi distant (seul le commit git local reste possible).
+
+Chaque backend expose :
+- push(local_path, remote_path, message, rewrite=False) -> bool (PersistenceConflict si l'écriture perdrait des données
+  distantes ; rewrite=True pour une réécriture volontaire qui raccourcit le fichier : rétention, réparation)
+- fetch(remote_path) -> bytes ou None
+- list_paths(prefix) -> chemins distants commençant par prefix (restauration des archives)
+"""
+import base64
+import datetime
+import hashlib
+import hmac
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+
+class PersistenceConflict(Exception):
+    """L'objet distant contient des données absentes du fichier local : l'écraser les perdrait."""
+
+
+class PersistenceBackend:
+    """Interface commune des backends de persistance."""
+
+    name = 'none'
+
+    def push(self, local_path, remote_path, message, rewrite=False):
+        """Envoie le fichier local vers remote_path. Retourne True si réussi.
+        rewrite=True : le fichier local a été volontairement réécrit et ne prolonge plus l'objet distant."""
+        raise NotImplementedError
+
+    def fetch(self, remote_path):
+        """Retourne le contenu distant de remote_path, ou None s'il est absent."""
+        raise NotImplementedError
+
+    def list_paths(self, prefix):
+        """Retourne les chemins distants commençant par prefix. Lève une exception si la liste
+        n'a pas pu être obtenue (une liste vide signifie qu'il n'y a rien)."""
+        raise NotImplementedError
+
+
+class GitHubBackend(PersistenceBackend):
+    """Persistance via l'API GitHub contents (un commit par envoi)."""
+
+    name = 'github'
+
+    def __init__(self, token, owner, repo, branch='main'):
+        self.token = token
+        self.owner = owner
+        self.repo = repo
+        self.branch = branch
+
+    def push(self, local_path, remote_path, message, rewrite=False):
+        if not self.token:
+            print("ℹ️ GitHub API non configuré (GITHUB_TOKEN manquant)")
+            return False
+        import requests  # import différé : uniquement utile à la persistance distante
+        get_url = f"https://api.github.com/repos/{self.owner}/{self.repo}/contents/{remote_path}?ref={self.branch}"
+        put_url = f"https://api.github.com/repos/{self.owner}/{self.repo}/contents/{remote_path}"
+        headers = {
+            'Authorization': f'Bearer {self.token}',
+            'Accept': 'application/vnd.github+json'
+        }
+        sha = None
+        r = requests.get(get_url, headers=headers, timeout=10)
+        if r.status_code == 200 and isinstance(r.json(), dict):
+            sha = r.json().get('sha')
+            print(f"ℹ️ SHA récupéré: {sha[:8]}...")
+        with open(local_path, 'rb') as rf:
+            content_b64 = base64.b64encode(rf.read()).decode('ascii')
+        payload = {
+            'message': message,
+            'content': content_b64,
+            'branch': self.branch,
+            'committer': {'name': 'Results Bot', 'email': 'results-bot@local'}
+        }
+        if sha:
+            payload['sha'] = sha
+        pr = requests.put(put_url, headers=headers, json=payload, timeout=20)
+        if pr.status_code in (200, 201):
+            print(f"✅ Données pushées vers GitHub: {message}")
+            return True
+        print(f"⚠️ Premier PUT échoué ({pr.status_code}), retry...")
+        # Retry: récupérer le SHA et réessayer
+        r2 = requests.get(get_url, headers=headers, timeout=10)
+        if r2.status_code == 200 and isinstance(r2.json(), dict):
+            payload['sha'] = r2.json().get('sha')
+            pr2 = requests.put(put_url, headers=headers, json=payload, timeout=20)
+            if pr2.status_code in (200, 201):
+                print(f"✅ Données pushées vers GitHub (retry): {message}")
+                return True
+            print(f"⚠️ Push GitHub échoué (retry): {pr2.status_code}")
+        else:
+            print(f"⚠️ Récupération SHA échouée (retry): {r2.status_code}")
+        return False
+
+    def fetch(self, remote_path):
+        import requests  # import différé : uniquement utile à la persistance distante
+        url = f"https://raw.githubusercontent.com/{self.owner}/{self.repo}/{self.branch}/{remote_path}"
+        headers = {'Authorization': f"Bearer {self.token}"} if self.token else {}
+        resp = requests.get(url, headers=headers, timeout=5)
+        if resp.status_code == 200 and resp.content:
+            return resp.content
+        return None
+
+    def list_paths(self, prefix):
+        import requests  # import différé : uniquement utile à la persistance distante
+        url = f"https://api.github.com/repos/{self.owner}/{self.repo}/git/trees/{self.branch}?recursive=1"
+        headers = {'Accept': 'application/vnd.github+json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        resp = requests.get(url, headers=headers, timeout=10)
+        if resp.status_code != 200:
+            raise IOError(f'liste GitHub: HTTP {resp.status_code}')
+        tree = resp.json()
+        if tree.get('truncated'):
+            raise IOError('liste GitHub tronquée')
+        return [item['path'] for item in tree.get('tree', [])
+                if item.get('type') == 'blob' and item['path'].startswith(prefix)]
+
+
+class S3Backend(PersistenceBackend):
+    """Persistance vers un stockage objet compatible S3, signée en AWS Signature V4.
+
+    - connexions HTTP réutilisées (pool de taille `workers`) ;
+    - fichiers > part_size envoyés en multipart, parties envoyées en parallèle ;
+    - écritures conditionnelles : If-Match sur le dernier ETag connu (ou If-None-Match: *
+      pour une création). Sans ETag connu (premier envoi du processus, ou après un 412), l'objet
+      distant est relu : il n'est remplacé que si le fichier local le prolonge, sinon PersistenceConflict.
+      Une réécriture volontaire (rewrite=True) remplace la version distante courante sans ce contrôle.
+    """
+
+    name = 's3'
+    MIN_PART_SIZE = 5 * 1024 * 1024  # minimum imposé par S3 (sauf dernière partie)
+
+    def __init__(self, bucket, access_key, secret_key, endpoint_url=None, region='us-east-1',
+                 prefix='', part_size=8 * 1024 * 1024, workers=4):
+        import requests  # import différé : uniquement utile à la persistance distante
+        from requests.adapters import HTTPAdapter
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.endpoint_url = (endpoint_url or f'https://s3.{region}.amazonaws.com').rstrip('/')
+        self.prefix = prefix.strip('/')
+        self.part_size = max(self.MIN_PART_SIZE, part_size)
+        self.workers = max(1, workers)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.etags = {}  # clé -> dernier ETag écrit ou lu
+        self.etags_lock = threading.Lock()
+
+    # --- Signature V4 ---
+
+    def _key(self, remote_path):
+        return f'{self.prefix}/{remote_path}' if self.prefix else remote_path
+
+    def _sign(self, method, key, query, headers, payload_hash):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        date_stamp = now.strftime('%Y%m%d')
+        host = urlsplit(self.endpoint_url).netloc
+        base_path = urlsplit(self.endpoint_url).path.rstrip('/')
+        canonical_uri = quote(f'{base_path}/{self.bucket}/{key}', safe='/-_.~')
+        canonical_query = '&'.join(
+            f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(query.items())
+        )
+        headers = dict(headers, host=host, **{'x-amz-date': amz_date, 'x-amz-content-sha256': payload_hash})
+        signed = sorted(k.lower() for k in headers if k.lower() == 'host' or k.lower().startswith('x-amz-'))
+        lowered = {k.lower(): str(v).strip() for k, v in headers.items()}
+        canonical_headers = ''.join(f'{k}:{lowered[k]}\n' for k in signed)
+        signed_headers = ';'.join(signed)
+        canonical_request = '\n'.join([method, canonical_uri, canonical_query, canonical_headers, signed_headers, payload_hash])
+        scope = f'{date_stamp}/{self.region}/s3/aws4_request'
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+        ])
+        signing_key = ('AWS4' + self.secret_key).encode('utf-8')
+        for part in (date_stamp, self.region, 's3', 'aws4_request'):
+            signing_key = hmac.new(signing_key, part.encode('utf-8'), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        headers['Authorization'] = (
+            f'AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, '
+            f'SignedHeaders={signed_headers}, Signature={signature}'
+        )
+        url = f'{self.endpoint_url}/{self.bucket}/{quote(key, safe="/-_.~")}'
+        if canonical_query:
+            url += '?' + canonical_query
+        return url, headers
+
+    def _request(self, method, key, query=None, headers=None, data=b''):
+        payload_hash = hashlib.sha256(data).hexdigest()
+        url, signed_headers = self._sign(method, key, query or {}, headers or {}, payload_hash)
+        return self.session.request(method, url, headers=signed_headers, data=data, timeout=30)
+
+    # --- Écritures ---
+
+    def _precondition(self, key, local_path, rewrite=False):
+        """En-têtes conditionnels de l'écriture de local_path vers key."""
+        with self.etags_lock:
+            etag = self.etags.get(key)
+        if etag:
+            return {'If-Match': etag}
+        resp = self._request('HEAD', key)
+        if resp.status_code == 404:
+            return {'If-None-Match': '*'}
+        if resp.status_code != 200:
+            raise IOError(f'HEAD {key}: HTTP {resp.status_code}')
+        etag = resp.headers.get('ETag')
+        if rewrite:
+            return {'If-Match': etag}
+        if not self._extends(local_path, key, int(resp.headers.get('Content-Length', '0')), etag):
+            raise PersistenceConflict(f"{key} a été modifié par un autre écrivain (données absentes du fichier local)")
+        self._remember(key, etag)
+        return {'If-Match': etag}
+
+    def _extends(self, local_path, key, length, etag):
+        """Vrai si les `length` premiers octets de local_path sont l'objet distant `etag`."""
+        if not etag or os.path.getsize(local_path) < length:
+            return False
+        if re.fullmatch(r'[0-9a-f]{32}', etag.strip('"')):
+            # ETag d'un envoi simple = MD5 du contenu : comparaison sans téléchargement
+            digest = hashlib.md5()
+            with open(local_path, 'rb') as f:
+                remaining = length
+                while remaining > 0:
+                    block = f.read(min(1024 * 1024, remaining))
+                    if not block:
+                        break
+                    digest.update(block)
+                    remaining -= len(block)
+            if digest.hexdigest() == etag.strip('"'):
+                return True
+        # ETag multipart ou chiffré (pas un MD5) : relire l'objet
+        resp = self._request('GET', key, headers={'If-Match': etag})
+        if resp.status_code != 200:
+            return False
+        with open(local_path, 'rb') as f:
+            return f.read(len(resp.content)) == resp.content
+
+    def _remember(self, key, etag):
+        if etag:
+            with self.etags_lock:
+                self.etags[key] = etag
+
+    def _forget(self, key):
+        with self.etags_lock:
+            self.etags.pop(key, None)
+
+    def _put_single(self, key, data, conditions):
+        resp = self._request('PUT', key, headers=conditions, data=data)
+        if resp.status_code == 200:
+            self._remember(key, resp.headers.get('ETag'))
+        return resp.status_code
+
+    def _put_multipart(self, local_path, key, size, conditions):
+        resp = self._request('POST', key, query={'uploads': ''})
+        if resp.status_code != 200:
+            return resp.status_code
+        upload_id = ET.fromstring(resp.content).findtext('{*}UploadId')
+        offsets = list(range(0, size, self.part_size))
+
+        def upload_part(number, offset):
+            with open(local_path, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read(self.part_size)
+            part = self._request('PUT', key, query={'partNumber': str(number), 'uploadId': upload_id}, data=chunk)
+            if part.status_code != 200:
+                raise IOError(f'partie {number}: HTTP {part.status_code}')
+            return number, part.headers['ETag']
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                parts = list(pool.map(lambda args: upload_part(*args), enumerate(offsets, start=1)))
+            body = ''.join(
+                f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>' for number, etag in parts
+            )
+            complete = f'<CompleteMultipartUpload>{body}</CompleteMultipartUpload>'.encode('utf-8')
+            resp = self._request('POST', key, query={'uploadId': upload_id}, headers=conditions, data=complete)
+            # Une erreur peut être renvoyée dans un corps 200
+            if resp.status_code == 200 and b'<Error>' not in resp.content:
+                self._remember(key, ET.fromstring(resp.content).findtext('{*}ETag'))
+                return 200
+            status = resp.status_code if resp.status_code != 200 else 500
+        except Exception as e:
+            print(f"⚠️ Upload multipart S3 échoué: {e}")
+            status = 500
+        self._request('DELETE', key, query={'uploadId': upload_id})
+        return status
+
+    def push(self, local_path, remote_path, message, rewrite=False):
+        key = self._key(remote_path)
+        size = os.path.getsize(local_path)
+        for attempt in range(2):
+            conditions = self._precondition(key, local_path, rewrite)
+            if size > self.part_size:
+                status = self._put_multipart(local_path, key, size, conditions)
+            else:
+                with open(local_path, 'rb') as f:
+                    status = self._put_single(key, f.read(), conditions)
+            if status == 200:
+                print(f"✅ Données envoyées vers S3 ({key}): {message}")
+                return True
+            if status == 412 and attempt == 0:
+                # Objet modifié par un autre écrivain : ne réessayer que si le fichier local le prolonge
+                # (ou, pour une réécriture, contre la nouvelle version distante)
+                print(f"ℹ️ ETag S3 obsolète pour {key}, vérification de l'objet distant")
+                self._forget(key)
+                continue
+            print(f"⚠️ Envoi S3 échoué ({key}): HTTP {status}")
+            return False
+        return False
+
+    def fetch(self, remote_path):
+        key = self._key(remote_path)
+        resp = self._request('GET', key)
+        if resp.status_code != 200:
+            return None
+        self._remember(key, resp.headers.get('ETag'))
+        return resp.content
+
+    def list_paths(self, prefix):
+        base = self._key(prefix)
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        paths = []
+        token = None
+        while True:
+            query = {'list-type': '2', 'prefix': base}
+            if token:
+                query['continuation-token'] = token
+            resp = self._request('GET', '', query=query)
+            if resp.status_code != 200:
+                raise IOError(f'liste S3: HTTP {resp.status_code}')
+            root = ET.fromstring(resp.content)
+            paths.extend(element.text[strip:] for element in root.iterfind('{*}Contents/{*}Key'))
+            token = root.findtext('{*}NextContinuationToken')
+            if root.findtext('{*}IsTruncated') != 'true' or not token:
+                return paths
+
+
+_BACKEND = None
+_BACKEND_PID = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def create_backend():
+    """Instancie le backend selon PERSISTENCE_BACKEND (None si aucun n'est configuré)."""
+    gh_token = os.environ.get('GITHUB_TOKEN')
+    gh_owner = os.environ.get('GITHUB_OWNER')
+    gh_repo = os.environ.get('GITHUB_REPO')
+    default = 'github' if gh_owner and gh_repo else 'none'
+    choice = os.environ.get('PERSISTENCE_BACKEND', default).lower()
+
+    if choice == 's3':
+        bucket = os.environ.get('S3_BUCKET')
+        access_key = os.environ.get('S3_ACCESS_KEY_ID') or os.environ.get('AWS_ACCESS_KEY_ID')
+        secret_key = os.environ.get('S3_SECRET_ACCESS_KEY') or os.environ.get('AWS_SECRET_ACCESS_KEY')
+        if not (bucket and access_key and secret_key):
+            print("⚠️ Backend S3 demandé mais S3_BUCKET / clés d'accès manquants")
+            return None
+        return S3Backend(
+            bucket, access_key, secret_key,
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL'),
+            region=os.environ.get('S3_REGION', 'us-east-1'),
+            prefix=os.environ.get('S3_PREFIX', ''),
+            part_size=int(os.environ.get('S3_PART_SIZE', str(8 * 1024 * 1024))),
+            workers=int(os.environ.get('S3_UPLOAD_WORKERS', '4')),
+        )
+    if choice == 'github':
+        # Sans jeton, seule la lecture (récupération) d'un dépôt public est possible
+        if not (gh_owner and gh_repo):
+            print(f"ℹ️ GitHub API non configuré (token={bool(gh_token)}, owner={bool(gh_owner)}, repo={bool(gh_repo)})")
+            return None
+        return GitHubBackend(gh_token, gh_owner, gh_repo, os.environ.get('GITHUB_BRANCH', 'main'))
+    return None
+
+
+def get_backend():
+    """Backend partagé du processus, créé au premier usage."""
+    global _BACKEND, _BACKEND_PID
+    with _BACKEND_LOCK:
+        # Un backend hérité du maître gunicorn (--preload) partagerait ses connexions avec les autres workers
+        if _BACKEND is None or _BACKEND_PID != os.getpid():
+            _BACKEND = create_backend() or PersistenceBackend()
+            _BACKEND_PID = os.getpid()
+        return _BACKEND if _BACKEND.name != 'none' else None
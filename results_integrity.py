@@ -0,0 +1,551 @@
+"""Vérification et réparation du fichier de résultats CSV.
+
+- Sommes de contrôle : le fichier `<résultats>.sums` contient une ligne JSON par morceau
+  scellé (≈ CHUNK_BYTES, bornes sur des fins de ligne) avec son CRC32. Les morceaux sont
+  scellés au fil des ajouts (update_checksums) ou à l'écriture d'un nouveau fichier
+  (ChecksumWriter) ; la fin du fichier, non scellée, est seulement analysée.
+- verify(path, header, key_columns, full=False, all_chunks=False) -> rapport
+  Mode rapide (démarrage) : en-tête, fin tronquée, CRC des morceaux scellés depuis la dernière
+  vérification (`<résultats>.verified`, tous si all_chunks) et analyse de la fin non scellée.
+  Mode complet : CRC de tous les morceaux, analyse de tout le fichier et recherche des clés en double.
+  Les morceaux sont vérifiés en parallèle dans le pool de results_reader.
+- repair(path, header, key_columns, lock) -> rapport
+  Réécrit un fichier sain à côté (sans verrou), rattrape sous `lock` les lignes ajoutées
+  entre-temps puis le met en place par os.replace. Les lignes écartées (incomplètes,
+  en double, illisibles) sont conservées dans `<résultats>.rejected.csv`.
+
+Usage : python results_integrity.py [--full] [--repair]
+"""
+import csv
+import datetime
+import hashlib
+import io
+import json
+import os
+import re
+import time
+import zlib
+from collections import Counter
+from itertools import islice
+
+import results_reader
+
+CHUNK_BYTES = results_reader.CHUNK_BYTES
+SCAN_BYTES = results_reader.SCAN_BYTES
+MAX_REPORTED_CHUNKS = 20
+
+# {chemin: ((taille, mtime) du fichier de sommes, morceaux)}
+_CHECKSUMS = {}
+
+
+def sums_path(path):
+    return path + '.sums'
+
+
+def rejected_path(path):
+    return os.path.splitext(path)[0] + '.rejected.csv'
+
+
+def verified_path(path):
+    return path + '.verified'
+
+
+def _file_identity(path):
+    stat = os.stat(path)
+    return [stat.st_dev, stat.st_ino]
+
+
+def _crc_range(path, start, end):
+    """CRC32 des octets [start, end[ (exécuté dans le pool pour les gros fichiers)."""
+    crc = 0
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(SCAN_BYTES, remaining))
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+            remaining -= len(block)
+    return crc
+
+
+def _parallel(total_bytes):
+    return results_reader.PARSE_WORKERS > 1 and total_bytes >= results_reader.PARALLEL_MIN_BYTES
+
+
+def _map(function, tasks, total_bytes):
+    """Applique `function` aux tâches, dans le pool si le volume le justifie. Résultats dans l'ordre."""
+    if not _parallel(total_bytes) or len(tasks) <= 1:
+        return [function(*task) for task in tasks]
+    pool = results_reader.get_pool()
+    return [future.result() for future in [pool.submit(function, *task) for task in tasks]]
+
+
+def load_checksums(path):
+    """Morceaux scellés du fichier, ou None si les sommes sont absentes ou ne correspondent plus
+    à ce fichier (remplacé, tronqué ou en-tête modifié)."""
+    try:
+        stat = os.stat(sums_path(path))
+    except OSError:
+        return None
+    stamp = (stat.st_size, stat.st_mtime_ns)
+    cached = _CHECKSUMS.get(path)
+    if cached is not None and cached[0] == stamp:
+        meta, chunks = cached[1]
+    else:
+        try:
+            with open(sums_path(path), 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            meta = json.loads(lines[0])
+            chunks = [json.loads(line) for line in lines[1:] if line]
+        except (OSError, ValueError, IndexError):
+            return None
+        _CHECKSUMS[path] = (stamp, (meta, chunks))
+    try:
+        if meta.get('identity') != _file_identity(path):
+            return None
+        _, data_start = results_reader.read_header(path)
+        if meta.get('data_start') != data_start:
+            return None
+        if chunks and chunks[-1]['end'] > os.path.getsize(path):
+            return None
+    except OSError:
+        return None
+    return chunks
+
+
+def save_checksums(path, chunks):
+    """Enregistre les sommes d'un fichier qui vient d'être écrit (remplacement atomique)."""
+    _, data_start = results_reader.read_header(path)
+    meta = {'identity': _file_identity(path), 'data_start': data_start, 'chunk_bytes': CHUNK_BYTES}
+    tmp_path = sums_path(path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(meta) + '\n')
+        for chunk in chunks:
+            f.write(json.dumps(chunk) + '\n')
+    os.replace(tmp_path, sums_path(path))
+    _CHECKSUMS.pop(path, None)
+    return chunks
+
+
+def _verified_end(path, chunks):
+    """Fin du dernier morceau scellé dont le CRC a été contrôlé par une vérification précédente,
+    ou None si elle est inconnue ou ne correspond plus aux sommes actuelles (fichier remplacé)."""
+    try:
+        with open(verified_path(path), 'r', encoding='utf-8') as f:
+            mark = json.load(f)
+        if mark.get('identity') != _file_identity(path):
+            return None
+    except (OSError, ValueError, AttributeError):
+        return None
+    for chunk in reversed(chunks):
+        if chunk['end'] == mark.get('end') and chunk['crc32'] == mark.get('crc32'):
+            return chunk['end']
+    return None
+
+
+def _save_verified(path, chunk):
+    """Enregistre que les morceaux jusqu'à `chunk` (inclus) ont un CRC correct."""
+    tmp_path = verified_path(path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'identity': _file_identity(path), 'end': chunk['end'], 'crc32': chunk['crc32']}, f)
+    os.replace(tmp_path, verified_path(path))
+
+
+def _seal_range(path, start, end):
+    """Morceaux complets (≥ CHUNK_BYTES) de [start, end[ avec leur CRC."""
+    offsets = results_reader.split_offsets(path, start, CHUNK_BYTES, end)
+    ranges = [(s, e) for s, e in zip(offsets[:-1], offsets[1:]) if e - s >= CHUNK_BYTES]
+    crcs = _map(_crc_range, [(path, s, e) for s, e in ranges], end - start)
+    return [{'start': s, 'end': e, 'crc32': crc} for (s, e), crc in zip(ranges, crcs)]
+
+
+def rebuild_checksums(path):
+    """Recalcule toutes les sommes (fichier inconnu ou remplacé). À appeler sous le verrou des écritures."""
+    _, data_start = results_reader.read_header(path)
+    end = max(data_start, results_reader.complete_size(path))
+    return save_checksums(path, _seal_range(path, data_start, end))
+
+
+def update_checksums(path):
+    """Scelle les morceaux complétés par les derniers ajouts. À appeler sous le verrou des écritures,
+    après chaque ajout : tant que moins de CHUNK_BYTES ont été ajoutés, ne lit que l'en-tête."""
+    chunks = load_checksums(path)
+    if chunks is None:
+        return rebuild_checksums(path)
+    start = chunks[-1]['end'] if chunks else results_reader.read_header(path)[1]
+    if os.path.getsize(path) - start < CHUNK_BYTES:
+        return chunks
+    sealed = _seal_range(path, start, results_reader.complete_size(path))
+    if sealed:
+        with open(sums_path(path), 'a', encoding='utf-8') as f:
+            for chunk in sealed:
+                f.write(json.dumps(chunk) + '\n')
+        chunks = chunks + sealed
+    return chunks
+
+
+class ChecksumWriter:
+    """Écrit des lignes CSV dans un fichier ouvert en binaire et scelle un morceau (CRC32)
+    dès que CHUNK_BYTES octets ont été écrits depuis le précédent.
+    Les morceaux sont ensuite enregistrés par save_checksums() une fois le fichier en place."""
+
+    BATCH_ROWS = 1024
+
+    def __init__(self, f, header=None):
+        self.file = f
+        self.offset = 0
+        if header is not None:
+            data = self._encode([header])
+            self.file.write(data)
+            self.offset = len(data)
+        self.chunk_start = self.offset
+        self.crc = 0
+        self.chunks = []
+
+    @staticmethod
+    def _encode(rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+
+    def writerows(self, rows):
+        iterator = iter(rows)
+        while True:
+            batch = list(islice(iterator, self.BATCH_ROWS))
+            if not batch:
+                return
+            data = self._encode(batch)
+            self.file.write(data)
+            self.crc = zlib.crc32(data, self.crc)
+            self.offset += len(data)
+            if self.offset - self.chunk_start >= CHUNK_BYTES:
+                self.chunks.append({'start': self.chunk_start, 'end': self.offset, 'crc32': self.crc})
+                self.chunk_start = self.offset
+                self.crc = 0
+
+    def writerow(self, row):
+        self.writerows([row])
+
+
+DATE_PREFIX = re.compile(r'^\d{4}-\d{2}-\d{2}')
+
+
+def _is_header(row):
+    return 'session_id' in row and 'participant_id' in row
+
+
+def terminate_partial_line(path):
+    """Ajoute un saut de ligne si le fichier se termine par une ligne interrompue (arrêt brutal),
+    pour que l'ajout suivant ne s'y colle pas. À appeler sous le verrou des écritures."""
+    with open(path, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return False
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b'\n':
+            return False
+        f.write(b'\r\n')
+        return True
+
+
+def _key_digest(row, key_indexes):
+    key = '\x1f'.join(row[i] if i < len(row) else '' for i in key_indexes)
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+
+
+def _parse_range(path, start, end):
+    """Lignes CSV de [start, end[ ; les octets invalides sont remplacés par U+FFFD (exécuté dans le pool)."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8', errors='replace')
+    return [row for row in csv.reader(io.StringIO(text, newline='')) if row]
+
+
+def _row_problem(row, width):
+    """Raison du rejet d'une ligne de données, ou None si elle est correcte."""
+    joined = ''.join(row)
+    if '\x00' in joined:
+        return 'nul'
+    if '\ufffd' in joined:
+        return 'encoding'
+    if len(row) != width:
+        return 'width'
+    return None
+
+
+def _check_chunk(path, start, end, expected_crc, parse, width, key_indexes):
+    """Vérifie un morceau : CRC si connu, puis (si `parse`) lignes mal formées, en-têtes
+    intercalés et empreintes des clés (exécuté dans le pool)."""
+    result = {'start': start, 'end': end, 'crc_ok': None}
+    if expected_crc is not None:
+        result['crc_ok'] = _crc_range(path, start, end) == expected_crc
+    if not parse:
+        return result
+    problems = Counter()
+    keys = []
+    rows = 0
+    for row in _parse_range(path, start, end):
+        if _is_header(row):
+            problems['embedded_header'] += 1
+            continue
+        problem = _row_problem(row, width)
+        if problem:
+            problems[problem] += 1
+            continue
+        rows += 1
+        if key_indexes is not None:
+            keys.append(_key_digest(row, key_indexes))
+    result.update(rows=rows, problems=problems, keys=keys)
+    return result
+
+
+def verify(path, expected_header, key_columns, full=False, renamed=None, all_chunks=False):
+    """Vérifie le fichier sans le verrouiller et retourne un rapport (clé 'ok').
+    En mode rapide, seuls les morceaux scellés depuis la dernière vérification réussie sont
+    recontrôlés, sauf si `all_chunks`."""
+    started = time.perf_counter()
+    renamed = renamed or {}
+    header, data_start = results_reader.read_header(path)
+    size = os.path.getsize(path)
+    complete = max(data_start, results_reader.complete_size(path))
+    names = [renamed.get(name, name) for name in header]
+
+    report = {
+        'mode': 'full' if full else 'quick',
+        'size': size,
+        'header_ok': header == list(expected_header),
+        'legacy_columns': [name for name in header if name in renamed],
+        'missing_columns': [name for name in expected_header if name not in names],
+        'truncated_tail': size - complete,
+    }
+
+    chunks = load_checksums(path)
+    report['checksums'] = 'ok' if chunks is not None else ('missing' if not os.path.exists(sums_path(path)) else 'stale')
+    chunks = chunks or []
+    sealed_end = chunks[-1]['end'] if chunks else data_start
+    verified_end = None if full or all_chunks else _verified_end(path, chunks)
+    if verified_end is not None:
+        # Morceaux déjà contrôlés et immuables depuis : inutile de les relire
+        chunks_to_check = [c for c in chunks if c['end'] > verified_end]
+    else:
+        chunks_to_check = chunks
+
+    key_indexes = None
+    if full:
+        key_indexes = tuple(names.index(column) if column in names else len(names) for column in key_columns)
+    tasks = [(path, c['start'], c['end'], c['crc32'], full, len(header), key_indexes) for c in chunks_to_check]
+    # Fin non scellée (ou tout le fichier si les sommes manquent) : toujours analysée
+    offsets = results_reader.split_offsets(path, sealed_end, CHUNK_BYTES, complete)
+    tasks += [(path, s, e, None, True, len(header), key_indexes) for s, e in zip(offsets[:-1], offsets[1:]) if e > s]
+    results = _map(_check_chunk, tasks, complete - data_start)
+
+    problems = Counter()
+    rows = 0
+    corrupted = []
+    seen = set()
+    duplicates = 0
+    for result in results:
+        if result['crc_ok'] is False:
+            corrupted.append([result['start'], result['end']])
+        problems.update(result.get('problems', {}))
+        rows += result.get('rows', 0)
+        for key in result.get('keys', ()):
+            if key in seen:
+                duplicates += 1
+            else:
+                seen.add(key)
+
+    report.update({
+        'sealed_chunks': len(chunks),
+        'crc_checked_chunks': len(chunks_to_check),
+        'corrupted_chunks': corrupted[:MAX_REPORTED_CHUNKS],
+        'corrupted_count': len(corrupted),
+        'parsed_rows': rows,
+        'bad_rows': problems['width'] + problems['nul'] + problems['encoding'],
+        'embedded_headers': problems['embedded_header'],
+        'problems': dict(problems),
+        'duplicates': duplicates if full else None,
+        'checked_bytes': complete - data_start,
+    })
+    report['ok'] = (
+        report['header_ok'] and not report['truncated_tail'] and not corrupted
+        and not problems and not duplicates
+    )
+    if chunks and not corrupted:
+        try:
+            _save_verified(path, chunks[-1])
+        except OSError:
+            pass  # dossier en lecture seule : la prochaine vérification recontrôlera ces morceaux
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+class _Layout:
+    """Correspondance entre les colonnes d'un en-tête du fichier et l'en-tête attendu."""
+
+    def __init__(self, header, expected, renamed):
+        names = [renamed.get(name, name) for name in header]
+        positions = {name: index for index, name in enumerate(names)}
+        self.width = len(header)
+        self.mapping = [positions.get(name) for name in expected]
+        self.identity = names == expected
+
+    def apply(self, row):
+        return row if self.identity else [row[i] if i is not None else '' for i in self.mapping]
+
+
+class _Normalizer:
+    """Remet les lignes au format attendu, dans l'ordre du fichier. Un en-tête intercalé
+    (fichiers concaténés, ancien schéma) s'applique aux lignes suivantes dont l'horodatage
+    reste plausible ; sinon la ligne est relue avec l'en-tête du fichier (ajouts ultérieurs)."""
+
+    def __init__(self, header, expected_header, key_columns, renamed):
+        self.expected = list(expected_header)
+        self.renamed = renamed
+        self.key_indexes = [self.expected.index(column) for column in key_columns]
+        self.timestamp_index = self.expected.index('timestamp') if 'timestamp' in self.expected else None
+        self.seen = set()
+        self.counts = Counter()
+        self.base = self.current = _Layout(header, self.expected, renamed)
+
+    def plausible(self, row):
+        return self.timestamp_index is None or bool(DATE_PREFIX.match(row[self.timestamp_index]))
+
+    def normalize(self, row):
+        """Ligne au format attendu, ou (None, raison du rejet)."""
+        problem = _row_problem(row, self.current.width)
+        if problem in ('nul', 'encoding'):
+            return None, problem
+        candidates = [layout for layout in (self.current, self.base) if layout.width == len(row)]
+        for layout in candidates:
+            normalized = layout.apply(row)
+            if self.plausible(normalized):
+                return normalized, None
+        if candidates:
+            return candidates[0].apply(row), None
+        return None, 'width'
+
+    def feed(self, rows, writer, rejected):
+        kept = []
+        for row in rows:
+            if _is_header(row):
+                self.current = _Layout(row, self.expected, self.renamed)
+                self.counts['embedded_header'] += 1
+                continue
+            normalized, problem = self.normalize(row)
+            if problem is None:
+                row = normalized
+                key = tuple(row[i] for i in self.key_indexes)
+                if key in self.seen:
+                    problem = 'duplicate'
+                else:
+                    self.seen.add(key)
+                    kept.append(row)
+                    continue
+            self.counts[problem] += 1
+            rejected.writerow([problem, datetime.datetime.now().isoformat()] + row)
+        writer.writerows(kept)
+        self.counts['rows'] += len(kept)
+
+
+def _parsed_ranges(path, start, end):
+    """Lignes de [start, end[ par morceaux, dans l'ordre ; au plus PARSE_WORKERS morceaux en mémoire."""
+    offsets = results_reader.split_offsets(path, start, CHUNK_BYTES, end)
+    ranges = [(s, e) for s, e in zip(offsets[:-1], offsets[1:]) if e > s]
+    if not _parallel(end - start) or len(ranges) <= 1:
+        for s, e in ranges:
+            yield _parse_range(path, s, e)
+        return
+    pool = results_reader.get_pool()
+    pending = []
+    for s, e in ranges:
+        pending.append(pool.submit(_parse_range, path, s, e))
+        if len(pending) >= results_reader.PARSE_WORKERS:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+def _repair_once(path, expected_header, key_columns, lock, renamed):
+    identity = _file_identity(path)
+    header, data_start = results_reader.read_header(path)
+    end = max(data_start, results_reader.complete_size(path))
+    normalizer = _Normalizer(header, expected_header, key_columns, renamed)
+    tmp_path = path + '.repair'
+    try:
+        with open(tmp_path, 'wb') as out, open(rejected_path(path), 'a', newline='', encoding='utf-8') as rejected_file:
+            writer = ChecksumWriter(out, expected_header)
+            rejected = csv.writer(rejected_file)
+            # Phase 1, sans verrou : l'essentiel du fichier
+            for rows in _parsed_ranges(path, data_start, end):
+                normalizer.feed(rows, writer, rejected)
+            out.flush()
+            os.fsync(out.fileno())
+            # Phase 2, sous verrou : lignes ajoutées entre-temps, fin tronquée, remplacement
+            with lock():
+                if _file_identity(path) != identity:
+                    return None  # fichier remplacé (rétention...) : recommencer
+                size = os.path.getsize(path)
+                complete = max(end, results_reader.complete_size(path))
+                for rows in _parsed_ranges(path, end, complete):
+                    normalizer.feed(rows, writer, rejected)
+                if size > complete:
+                    # Aucun ajout n'est en cours sous le verrou : cette fin est une ligne interrompue
+                    with open(path, 'rb') as f:
+                        f.seek(complete)
+                        tail = f.read().decode('utf-8', errors='replace')
+                    rejected.writerow(['truncated', datetime.datetime.now().isoformat(), tail])
+                    normalizer.counts['truncated'] += 1
+                # Seules les lignes du rattrapage restent à synchroniser
+                out.flush()
+                os.fsync(out.fileno())
+                rejected_file.flush()
+                os.replace(tmp_path, path)
+                save_checksums(path, writer.chunks)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    counts = normalizer.counts
+    return {
+        'rows': counts['rows'],
+        'removed': sum(count for reason, count in counts.items() if reason not in ('rows', 'embedded_header')),
+        'reasons': {reason: count for reason, count in counts.items() if reason != 'rows'},
+        'size_before': size,
+        'size_after': os.path.getsize(path),
+        'rejected_file': rejected_path(path),
+    }
+
+
+def repair(path, expected_header, key_columns, lock, renamed=None, attempts=3):
+    """Réécrit le fichier au format attendu, sans lignes incomplètes, illisibles ni doublons.
+    `lock` : gestionnaire de contexte du verrou des écritures, tenu seulement pendant le rattrapage
+    final et le remplacement."""
+    started = time.perf_counter()
+    for _ in range(attempts):
+        report = _repair_once(path, expected_header, key_columns, lock, renamed or {})
+        if report is not None:
+            report['seconds'] = round(time.perf_counter() - started, 3)
+            return report
+    raise RuntimeError("Le fichier de résultats a été remplacé pendant chaque tentative de réparation")
+
+
+def main():
+    import argparse
+    import app
+
+    parser = argparse.ArgumentParser(description="Vérification du fichier de résultats")
+    parser.add_argument('--full', action='store_true', help="analyse complète (doublons compris)")
+    parser.add_argument('--repair', action='store_true', help="réparer si des problèmes sont trouvés")
+    parser.add_argument('--all-chunks', action='store_true', help="recontrôler le CRC de tous les morceaux scellés")
+    args = parser.parse_args()
+
+    report = app.verify_results(full=args.full or args.repair, all_chunks=args.all_chunks or app.RESULTS_VERIFY_ALL_CHUNKS)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.repair and not report['ok']:
+        print(json.dumps(app.repair_results(), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
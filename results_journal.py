@@ -0,0 +1,197 @@
+"""Journal d'intentions pour les écritures groupées (imports, migrations, rétention).
+
+Une opération (Transaction) prépare ses fichiers dans le dossier du journal puis les met
+en place en une fois :
+1. chaque nouveau contenu de fichier est écrit dans un segment du journal (segment()) ;
+2. commit() : fsync des segments, écriture de l'entrée (étapes et octets à ajouter), fsync,
+   renommage en `.pending` (point de validation) puis fsync du dossier ;
+3. les étapes sont appliquées (renommages atomiques, ajout en fin de fichier), les dossiers
+   concernés synchronisés, puis l'entrée supprimée.
+
+replay() termine les entrées `.pending` laissées par un arrêt brutal ; il est appelé au démarrage
+et à chaque prise du verrou des écritures, avant toute autre écriture. Les étapes sont
+idempotentes : un renommage déjà fait est ignoré, un ajout repart de sa position d'origine.
+Les segments d'opérations jamais validées sont supprimés après ORPHAN_SECONDS.
+"""
+import json
+import os
+import time
+import uuid
+
+PENDING_SUFFIX = '.pending'
+ORPHAN_SECONDS = 3600
+
+
+def fsync_dir(path):
+    """Rend durables les créations et renommages d'un dossier (ignoré si le système le refuse)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _fsync_file(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Transaction:
+    """Opération groupée sur un ou plusieurs fichiers, appliquée entièrement ou rejouée au redémarrage.
+    commit() et les ajouts (append, dont la position d'origine est relevée à l'appel) doivent être
+    faits sous le verrou des écritures : replay() considère toute entrée `.pending` comme abandonnée.
+    Les segments peuvent être préparés hors du verrou."""
+
+    def __init__(self, journal_dir):
+        self.journal_dir = journal_dir
+        self.id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.steps = []
+        self.segments = []
+        self.payload = b''
+        os.makedirs(journal_dir, exist_ok=True)
+
+    def segment(self, target):
+        """Chemin où écrire le nouveau contenu complet de `target` ; mis en place par commit()."""
+        path = os.path.join(self.journal_dir, f'{self.id}.{len(self.segments)}.seg')
+        self.segments.append(path)
+        self.steps.append({'op': 'rename', 'source': path, 'target': target})
+        return path
+
+    def move(self, source, target):
+        """Renomme un fichier existant (migration)."""
+        self.steps.append({'op': 'rename', 'source': source, 'target': target})
+
+    def append(self, target, data):
+        """Ajoute `data` à la fin de `target`."""
+        offset = os.path.getsize(target) if os.path.exists(target) else 0
+        self.steps.append({'op': 'append', 'target': target, 'offset': offset,
+                           'start': len(self.payload), 'length': len(data)})
+        self.payload += data
+
+    def commit(self):
+        """Valide l'opération (une seule synchronisation de l'entrée) puis l'applique."""
+        for path in self.segments:
+            _fsync_file(path)
+        tmp_path = os.path.join(self.journal_dir, f'{self.id}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps({'id': self.id, 'steps': self.steps}).encode('utf-8') + b'\n')
+            f.write(self.payload)
+            f.flush()
+            os.fsync(f.fileno())
+        entry_path = os.path.join(self.journal_dir, self.id + PENDING_SUFFIX)
+        os.replace(tmp_path, entry_path)
+        fsync_dir(self.journal_dir)
+        apply_entry(entry_path)
+
+    def abort(self):
+        """Abandonne une opération non validée."""
+        for path in self.segments:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        return False
+
+
+def _apply_append(target, offset, data):
+    fd = os.open(target, os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, 'r+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        # Un ajout interrompu a pu laisser une partie des octets : repartir de la position d'origine
+        f.truncate(min(size, offset))
+        f.seek(min(size, offset))
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def apply_entry(entry_path):
+    """Applique les étapes d'une entrée validée puis la supprime."""
+    with open(entry_path, 'rb') as f:
+        meta = json.loads(f.readline())
+        payload = f.read()
+    directories = set()
+    for step in meta['steps']:
+        target = step['target']
+        if step['op'] == 'rename':
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.replace(step['source'], target)
+            except FileNotFoundError:
+                pass  # déjà renommé
+            directories.add(os.path.dirname(target))
+        elif step['op'] == 'append':
+            data = payload[step['start']:step['start'] + step['length']]
+            if len(data) != step['length']:
+                raise ValueError(f"Entrée de journal incomplète: {entry_path}")
+            _apply_append(target, step['offset'], data)
+    for directory in directories:
+        fsync_dir(directory)
+    try:
+        os.remove(entry_path)
+    except FileNotFoundError:
+        pass
+    fsync_dir(os.path.dirname(entry_path))
+    return meta
+
+
+def replay(journal_dir):
+    """Termine les opérations validées mais interrompues, dans l'ordre. Retourne leur nombre."""
+    try:
+        names = sorted(os.listdir(journal_dir))
+    except FileNotFoundError:
+        return 0
+    replayed = 0
+    pending_ids = set()
+    for name in names:
+        if name.endswith(PENDING_SUFFIX):
+            pending_ids.add(name[:-len(PENDING_SUFFIX)])
+            apply_entry(os.path.join(journal_dir, name))
+            replayed += 1
+    # Fichiers d'opérations jamais validées (arrêt avant commit) : supprimés une fois anciens
+    now = time.time()
+    for name in names:
+        if name.endswith(PENDING_SUFFIX) or name.split('.', 1)[0] in pending_ids:
+            continue
+        path = os.path.join(journal_dir, name)
+        try:
+            if now - os.path.getmtime(path) > ORPHAN_SECONDS:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+    return replayed
+
+
+def write_file(journal_dir, target, data):
+    """Remplace entièrement `target` par `data` (octets). Comme les deux suivantes, à appeler sous le verrou des écritures."""
+    with Transaction(journal_dir) as transaction:
+        with open(transaction.segment(target), 'wb') as f:
+            f.write(data)
+        transaction.commit()
+
+
+def move_file(journal_dir, source, target):
+    """Renomme `source` en `target` de façon durable."""
+    with Transaction(journal_dir) as transaction:
+        transaction.move(source, target)
+        transaction.commit()
+
+
+def append_file(journal_dir, target, data):
+    """Ajoute `data` à la fin de `target` : une synchronisation pour l'entrée, une pour le fichier."""
+    with Transaction(journal_dir) as transaction:
+        transaction.append(target, data)
+        transaction.commit()
@@ -0,0 +1,207 @@
+"""Lecture rapide du fichier de résultats CSV.
+
+Le fichier est découpé en morceaux à des fins de ligne sûres (hors champ entre
+guillemets), analysés en parallèle dans un pool de processus puis recollés
+dans l'ordre. Les petits fichiers sont lus directement, sans pool.
+
+- read_rows(path, columns=None) -> (en-tête, liste de tuples)
+- read_range(path, header, start, end) -> tuples d'un intervalle d'octets (lecture incrémentale)
+- iter_rows(path, columns=None) -> en-tête puis tuples, mémoire bornée
+- count_rows(path) -> nombre de lignes de données
+"""
+import csv
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+# Nombre de processus d'analyse (0 = toujours séquentiel)
+PARSE_WORKERS = int(os.environ.get('CSV_PARSE_WORKERS', str(min(8, os.cpu_count() or 1))))
+# En dessous de cette taille, le coût du pool dépasse le gain
+PARALLEL_MIN_BYTES = int(os.environ.get('CSV_PARALLEL_MIN_BYTES', str(16 * 1024 * 1024)))
+CHUNK_BYTES = 4 * 1024 * 1024
+SCAN_BYTES = 1024 * 1024
+
+_POOL = None
+_POOL_PID = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool():
+    """Pool de processus partagé, créé à la première lecture volumineuse.
+    forkserver évite de dupliquer les verrous tenus par les threads du serveur web."""
+    global _POOL, _POOL_PID
+    with _POOL_LOCK:
+        # Un pool hérité du maître gunicorn (--preload) n'est pas utilisable dans un worker
+        if _POOL is None or _POOL_PID != os.getpid():
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            _POOL = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=context)
+            _POOL_PID = os.getpid()
+        return _POOL
+
+
+def read_header(path):
+    """Retourne (en-tête, position du début des données)."""
+    with open(path, 'rb') as f:
+        line = f.readline()
+        header = next(csv.reader([line.decode('utf-8-sig')]), [])
+        return header, f.tell()
+
+
+def complete_size(path):
+    """Taille du fichier sans la dernière ligne si elle est incomplète (écriture en cours)."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        position = size
+        while position > 0:
+            step = min(SCAN_BYTES, position)
+            f.seek(position - step)
+            block = f.read(step)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                return position - step + newline + 1
+            position -= step
+    return 0
+
+
+def split_offsets(path, start, chunk_bytes, end=None):
+    """Découpe [start, end[ (par défaut jusqu'à la dernière ligne complète) en morceaux d'environ
+    chunk_bytes, coupés après un saut de ligne situé hors guillemets : la parité du nombre de '"'
+    depuis `start` doit être paire (les guillemets échappés "" comptent double et ne changent pas la parité)."""
+    size = complete_size(path) if end is None else end
+    offsets = [start]
+    if size <= start:
+        return offsets + [start]
+    with open(path, 'rb') as f:
+        position = start
+        quotes = 0
+        target = start + chunk_bytes
+        while target < size:
+            # Compter les guillemets jusqu'à la cible
+            f.seek(position)
+            while position < target:
+                block = f.read(min(SCAN_BYTES, target - position))
+                quotes += block.count(b'"')
+                position += len(block)
+            # Avancer jusqu'au premier saut de ligne hors guillemets
+            boundary = None
+            while boundary is None and position < size:
+                block = f.read(SCAN_BYTES)
+                index = 0
+                while True:
+                    newline = block.find(b'\n', index)
+                    if newline == -1:
+                        quotes += block.count(b'"', index)
+                        position += len(block)
+                        break
+                    quotes += block.count(b'"', index, newline)
+                    index = newline + 1
+                    if quotes % 2 == 0:
+                        boundary = position + index
+                        position = boundary
+                        break
+            if boundary is None or boundary >= size:
+                break
+            offsets.append(boundary)
+            target = boundary + chunk_bytes
+    offsets.append(size)
+    return offsets
+
+
+def _parse_chunk(path, start, end, columns):
+    """Analyse les octets [start, end[ et retourne une liste de tuples (exécuté dans le pool)."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    reader = csv.reader(io.StringIO(text, newline=''))
+    if columns is None:
+        return list(map(tuple, filter(None, reader)))
+    getter = itemgetter(*columns) if len(columns) > 1 else (lambda row, i=columns[0]: (row[i],))
+    rows = []
+    for row in filter(None, reader):
+        try:
+            rows.append(getter(row))
+        except IndexError:  # ligne courte ou colonne absente
+            rows.append(tuple(row[i] if i < len(row) else '' for i in columns))
+    return rows
+
+
+def _count_chunk(path, start, end):
+    """Nombre de lignes de données dans [start, end[ (exécuté dans le pool)."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    return sum(1 for row in csv.reader(io.StringIO(text, newline='')) if row)
+
+
+def _column_indexes(header, columns):
+    if columns is None:
+        return None
+    return tuple(header.index(name) if name in header else len(header) for name in columns)
+
+
+def _chunks(path, start, end=None):
+    """Morceaux à analyser : un seul si le fichier est petit ou le parallélisme désactivé."""
+    size = complete_size(path) if end is None else end
+    if PARSE_WORKERS <= 1 or size - start < PARALLEL_MIN_BYTES:
+        return [(start, max(start, size))], False
+    chunk_bytes = max(CHUNK_BYTES, (size - start) // (PARSE_WORKERS * 4) + 1)
+    offsets = split_offsets(path, start, chunk_bytes, size)
+    return list(zip(offsets[:-1], offsets[1:])), True
+
+
+def read_rows(path, columns=None, end=None):
+    """Lit tout le fichier (ou jusqu'à l'octet `end`, qui doit suivre une fin de ligne).
+    `columns` (noms) restreint et ordonne les champs retournés.
+    Retourne (en-tête, lignes) où les lignes sont des tuples, dans l'ordre du fichier."""
+    header, start = read_header(path)
+    indexes = _column_indexes(header, columns)
+    chunks, parallel = _chunks(path, start, end)
+    if not parallel:
+        return header, _parse_chunk(path, start, chunks[0][1], indexes)
+    pool = get_pool()
+    futures = [pool.submit(_parse_chunk, path, s, e, indexes) for s, e in chunks]
+    rows = []
+    for future in futures:
+        rows.extend(future.result())
+    return header, rows
+
+
+def read_range(path, header, start, end, columns=None):
+    """Analyse les lignes de l'intervalle [start, end[ (bornes sur des fins de ligne)."""
+    return _parse_chunk(path, start, end, _column_indexes(header, columns))
+
+
+def iter_rows(path, columns=None, chunk_bytes=CHUNK_BYTES):
+    """Variante en flux : produit l'en-tête puis les tuples, morceau par morceau.
+    Au plus PARSE_WORKERS morceaux sont en mémoire à la fois."""
+    header, start = read_header(path)
+    yield header
+    indexes = _column_indexes(header, columns)
+    offsets = split_offsets(path, start, chunk_bytes)
+    chunks = list(zip(offsets[:-1], offsets[1:]))
+    if PARSE_WORKERS <= 1 or len(chunks) <= 1:
+        for s, e in chunks:
+            yield from _parse_chunk(path, s, e, indexes)
+        return
+    pool = get_pool()
+    pending = []
+    for s, e in chunks:
+        pending.append(pool.submit(_parse_chunk, path, s, e, indexes))
+        if len(pending) >= PARSE_WORKERS:
+            yield from pending.pop(0).result()
+    for future in pending:
+        yield from future.result()
+
+
+def count_rows(path):
+    """Compte les lignes de données (les champs multi-lignes comptent pour une)."""
+    _, start = read_header(path)
+    chunks, parallel = _chunks(path, start)
+    if not parallel:
+        return _count_chunk(path, start, chunks[0][1])
+    pool = get_pool()
+    return sum(future.result() for future in [pool.submit(_count_chunk, path, s, e) for s, e in chunks])
@@ -0,0 +1,208 @@
+"""Simulation hors ligne de la génération des essais.
+
+Génère un grand nombre d'essais avec les fonctions de app.py (generate_trial,
+get_choices) répartis sur un pool de processus, puis rapporte :
+- le débit de génération (essais/s) ;
+- l'équilibre des catégories (mots / non-mots) et la fréquence des stimuli ;
+- le recouvrement entre stimulus et distracteurs (lettres communes à la même
+  position, même longueur, même début, même fin) ;
+- la position de la bonne réponse parmi les choix ;
+- la fréquence des paires couleur de texte / couleur de fond par bloc.
+
+Chaque lot a son propre flux aléatoire dérivé de --seed : deux exécutions avec
+la même graine et la même taille de lot donnent les mêmes statistiques.
+
+Usage :
+    python simulate_trials.py --trials 1000000 --workers 8
+    python simulate_trials.py --json > rapport.json
+    python simulate_trials.py --replay <session_id>   # essais servis à une session
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import app
+
+BLOCK_TYPES = ('bw', 'color', 'colored_bg')
+TRIALS_PER_BLOCK = 10
+
+
+def letter_overlap(stimulus, distractor):
+    """Nombre de lettres identiques à la même position."""
+    return sum(1 for a, b in zip(stimulus, distractor) if a == b)
+
+
+def simulate_batch(seed, batch_index, count):
+    """Génère `count` essais (blocs en alternance) et retourne des compteurs agrégés (exécuté dans le pool)."""
+    if not app.DISTRACTOR_INDEX:  # processus du pool lancé sans copie du parent
+        app.build_distractor_index()
+    rng = app.trial_rng(seed, 'simulation', batch_index)
+    stats = {
+        'trials': Counter(),
+        'categories': Counter(),
+        'stimuli': Counter(),
+        'overlap': Counter(),
+        'same_length': 0,
+        'same_start': 0,
+        'same_end': 0,
+        'mixed_categories': 0,
+        'distractors': 0,
+        'correct_position': Counter(),
+        'color_pairs': Counter(),
+    }
+    for i in range(count):
+        block_type = BLOCK_TYPES[i % len(BLOCK_TYPES)]
+        trial = app.generate_trial(block_type, rng)
+        stimulus = trial['stimulus']
+        stats['trials'][block_type] += 1
+        stats['categories'][(block_type, 'mot' if trial['is_word'] else 'non-mot')] += 1
+        stats['stimuli'][stimulus] += 1
+        stats['correct_position'][trial['choices'].index(stimulus)] += 1
+        stats['color_pairs'][(block_type, trial['text_color'], trial['background_color'])] += 1
+        for distractor in trial['choices']:
+            if distractor == stimulus:
+                continue
+            stats['distractors'] += 1
+            stats['overlap'][letter_overlap(stimulus, distractor)] += 1
+            stats['same_length'] += len(distractor) == len(stimulus)
+            stats['same_start'] += distractor[:2] == stimulus[:2]
+            stats['same_end'] += distractor[-2:] == stimulus[-2:]
+            stats['mixed_categories'] += (distractor in app.WORD_SET) != trial['is_word']
+    return stats
+
+
+def merge(total, stats):
+    for key, value in stats.items():
+        if key not in total:
+            total[key] = value
+        else:
+            total[key] += value
+    return total
+
+
+def run(trials, workers, seed, batch_size):
+    """Répartit la génération sur `workers` processus et retourne (statistiques, durée en secondes)."""
+    app.build_distractor_index()
+    batches = [(seed, index, min(batch_size, trials - start)) for index, start in enumerate(range(0, trials, batch_size))]
+    started = time.perf_counter()
+    total = {}
+    if workers <= 1:
+        for batch in batches:
+            merge(total, simulate_batch(*batch))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for stats in pool.map(simulate_batch, *zip(*batches)):
+                merge(total, stats)
+    return total, time.perf_counter() - started
+
+
+def percent(part, whole):
+    return round(100.0 * part / whole, 2) if whole else 0.0
+
+
+def build_report(stats, elapsed, workers):
+    trials = sum(stats['trials'].values())
+    distractors = stats['distractors']
+    stimuli = stats['stimuli']
+    expected = trials / len(app.ALL_STIMULI)
+    return {
+        'trials': trials,
+        'workers': workers,
+        'seconds': round(elapsed, 3),
+        'trials_per_second': round(trials / elapsed) if elapsed else None,
+        'categories': {
+            block_type: {
+                category: percent(stats['categories'][(block_type, category)], stats['trials'][block_type])
+                for category in ('mot', 'non-mot')
+            }
+            for block_type in BLOCK_TYPES
+        },
+        'stimuli': {
+            'distinct': len(stimuli),
+            'lexicon': len(app.ALL_STIMULI),
+            'min_ratio': round(min(stimuli.values()) / expected, 3) if stimuli else None,
+            'max_ratio': round(max(stimuli.values()) / expected, 3) if stimuli else None,
+        },
+        'distractors': {
+            'count': distractors,
+            'overlap_histogram': {str(k): percent(v, distractors) for k, v in sorted(stats['overlap'].items())},
+            'mean_overlap': round(sum(k * v for k, v in stats['overlap'].items()) / distractors, 3) if distractors else 0,
+            'same_length': percent(stats['same_length'], distractors),
+            'same_start': percent(stats['same_start'], distractors),
+            'same_end': percent(stats['same_end'], distractors),
+            'mixed_categories': stats['mixed_categories'],
+        },
+        'correct_position': {str(k + 1): percent(v, trials) for k, v in sorted(stats['correct_position'].items())},
+        'color_pairs': {
+            block_type: {
+                f'{text} / {background}': percent(count, stats['trials'][block_type])
+                for (pair_block, text, background), count in stats['color_pairs'].most_common()
+                if pair_block == block_type
+            }
+            for block_type in BLOCK_TYPES
+        },
+    }
+
+
+def print_report(report):
+    print(f"✅ {report['trials']} essais en {report['seconds']}s "
+          f"({report['trials_per_second']} essais/s, {report['workers']} processus)")
+    print("\n📊 Catégories par bloc (%)")
+    for block_type, split in report['categories'].items():
+        print(f"  {block_type:<11} mots {split['mot']:>6}  non-mots {split['non-mot']:>6}")
+    stimuli = report['stimuli']
+    print(f"\n🔤 Stimuli tirés : {stimuli['distinct']}/{stimuli['lexicon']} "
+          f"(fréquence min {stimuli['min_ratio']}x, max {stimuli['max_ratio']}x de l'attendu)")
+    distractors = report['distractors']
+    print(f"\n🎯 Distracteurs ({distractors['count']})")
+    print(f"  lettres communes (même position) : moyenne {distractors['mean_overlap']}, "
+          + ', '.join(f"{k}: {v}%" for k, v in distractors['overlap_histogram'].items()))
+    print(f"  même longueur {distractors['same_length']}% | même début {distractors['same_start']}% | "
+          f"même fin {distractors['same_end']}%")
+    if distractors['mixed_categories']:
+        print(f"  ⚠️ {distractors['mixed_categories']} distracteur(s) d'une autre catégorie que le stimulus")
+    print("\n🔢 Position de la bonne réponse (%) : "
+          + ', '.join(f"{k}: {v}" for k, v in report['correct_position'].items()))
+    print("\n🎨 Paires texte / fond (%)")
+    for block_type, pairs in report['color_pairs'].items():
+        print(f"  {block_type} ({len(pairs)} paires)")
+        for pair, share in pairs.items():
+            print(f"    {pair}  {share}")
+
+
+def print_replay(session_id):
+    """Affiche les essais servis à une session (mêmes graines que /get_trial)."""
+    app.build_distractor_index()
+    for block_type in BLOCK_TYPES:
+        for trial_number in range(1, TRIALS_PER_BLOCK + 1):
+            trial = app.replay_trial(session_id, block_type, trial_number)
+            print(f"{block_type:<11} {trial_number:>2}  {trial['stimulus']:<10} "
+                  f"{trial['text_color']}/{trial['background_color']}  {', '.join(trial['choices'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulation de la génération des essais")
+    parser.add_argument('--trials', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', default='simulation')
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--json', action='store_true', help="rapport JSON sur la sortie standard")
+    parser.add_argument('--replay', metavar='SESSION_ID', help="affiche les essais servis à une session")
+    args = parser.parse_args()
+
+    if args.replay:
+        print_replay(args.replay)
+        return
+    stats, elapsed = run(args.trials, args.workers, args.seed, args.batch_size)
+    report = build_report(stats, elapsed, args.workers)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,355 @@
+// File d'attente persistante des résultats (IndexedDB) envoyée au serveur par lots
+class ResultQueue {
+    constructor(endpoint = '/save_results_batch') {
+        this.endpoint = endpoint;
+        this.dbName = 'experience-results';
+        this.storeName = 'pending';
+        this.batchSize = 10;
+        this.flushDelay = 2000;
+        this.maxBackoff = 30000;
+        this.beaconMaxBytes = 60000; // Limite des navigateurs ~64 Ko par beacon
+        
+        this.db = null;
+        this.pending = new Map(); // Copie en mémoire, nécessaire pour le beacon synchrone de pagehide
+        this.flushing = false;
+        this.flushTimer = null;
+        this.failures = 0;
+        this.retryAfter = 0;
+        
+        this.ready = this.openDatabase()
+            .then(() => this.loadPending())
+            .then(() => {
+                if (this.pending.size > 0) {
+                    console.log(`📦 ${this.pending.size} résultat(s) non envoyé(s) repris depuis IndexedDB`);
+                    this.scheduleFlush(0);
+                }
+            })
+            .catch(error => console.error('File de résultats: IndexedDB indisponible', error));
+        
+        window.addEventListener('pagehide', () => this.flushWithBeacon());
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'hidden') {
+                this.flushWithBeacon();
+            }
+        });
+        window.addEventListener('online', () => this.scheduleFlush(0));
+    }
+    
+    openDatabase() {
+        return new Promise((resolve, reject) => {
+            if (!window.indexedDB) {
+                reject(new Error('IndexedDB non supporté'));
+                return;
+            }
+            const request = indexedDB.open(this.dbName, 1);
+            request.onupgradeneeded = () => {
+                request.result.createObjectStore(this.storeName, { keyPath: 'result_id' });
+            };
+            request.onsuccess = () => {
+                this.db = request.result;
+                resolve();
+            };
+            request.onerror = () => reject(request.error);
+        });
+    }
+    
+    transaction(mode, operation) {
+        if (!this.db) {
+            return Promise.resolve();
+        }
+        return new Promise((resolve, reject) => {
+            const tx = this.db.transaction(this.storeName, mode);
+            const result = operation(tx.objectStore(this.storeName));
+            tx.oncomplete = () => resolve(result && result.result);
+            tx.onerror = () => reject(tx.error);
+        });
+    }
+    
+    async loadPending() {
+        const rows = await this.transaction('readonly', store => store.getAll());
+        // Les lignes refusées par le serveur restent dans IndexedDB (consultables) mais ne sont plus renvoyées
+        (rows || []).filter(row => !row.rejected).forEach(row => this.pending.set(row.result_id, row));
+    }
+    
+    generateId() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    }
+    
+    async enqueue(row) {
+        const entry = { ...row, result_id: this.generateId() };
+        this.pending.set(entry.result_id, entry);
+        try {
+            await this.ready;
+            await this.transaction('readwrite', store => store.put(entry));
+        } catch (error) {
+            console.error('Erreur lors de la persistance locale du résultat:', error);
+        }
+        this.scheduleFlush(this.pending.size >= this.batchSize ? 0 : this.flushDelay);
+        return entry.result_id;
+    }
+    
+    scheduleFlush(delay) {
+        if (this.flushTimer) {
+            clearTimeout(this.flushTimer);
+        }
+        this.flushTimer = setTimeout(() => {
+            this.flushTimer = null;
+            this.flush();
+        }, delay);
+    }
+    
+    async compress(text) {
+        if (!window.CompressionStream) {
+            return { body: text, encoding: null };
+        }
+        const stream = new Blob([text]).stream().pipeThrough(new CompressionStream('gzip'));
+        return { body: await new Response(stream).blob(), encoding: 'gzip' };
+    }
+    
+    async flush() {
+        if (this.flushing || this.pending.size === 0) {
+            return;
+        }
+        this.flushing = true;
+        const batch = Array.from(this.pending.values()).slice(0, this.batchSize);
+        try {
+            const { body, encoding } = await this.compress(JSON.stringify({ results: batch }));
+            const headers = { 'Content-Type': 'application/json' };
+            if (encoding) {
+                headers['Content-Encoding'] = encoding;
+            }
+            const response = await fetch(this.endpoint, { method: 'POST', headers, body });
+            if (response.status === 429 || response.status === 503) {
+                // Serveur saturé : respecter le délai demandé avant de réessayer
+                this.retryAfter = (parseInt(response.headers.get('Retry-After'), 10) || 1) * 1000;
+                throw new Error(`HTTP ${response.status}`);
+            }
+            const data = await response.json();
+            if (!response.ok || !data.success) {
+                throw new Error(data.error || `HTTP ${response.status}`);
+            }
+            
+            // Seules les lignes acceptées (enregistrées ou déjà présentes) quittent la file
+            const accepted = new Set(data.accepted || []);
+            const refused = batch.filter(row => !accepted.has(row.result_id));
+            batch.forEach(row => this.pending.delete(row.result_id));
+            await this.transaction('readwrite', store => {
+                accepted.forEach(id => store.delete(id));
+                refused.forEach(row => store.put({ ...row, rejected: true }));
+            });
+            this.failures = 0;
+            console.log(`✅ Lot envoyé: ${data.saved} ajout(s), ${data.duplicates} doublon(s)`);
+            if (refused.length > 0) {
+                console.warn(`⚠️ ${refused.length} résultat(s) refusé(s) par le serveur, conservé(s) dans IndexedDB:`, refused);
+            }
+        } catch (error) {
+            this.failures++;
+            console.error('❌ Échec d\'envoi du lot, nouvel essai programmé:', error);
+        } finally {
+            this.flushing = false;
+        }
+        
+        if (this.pending.size > 0) {
+            // Backoff exponentiel avec gigue après un échec
+            const backoff = this.failures === 0
+                ? 0
+                : Math.min(this.maxBackoff, 1000 * 2 ** (this.failures - 1)) * (0.5 + Math.random() / 2);
+            this.scheduleFlush(Math.max(backoff, this.retryAfter));
+            this.retryAfter = 0;
+        }
+    }
+    
+    async drain(onProgress, timeout = 60000) {
+        await this.ready;
+        const total = this.pending.size;
+        const deadline = Date.now() + timeout;
+        while (this.pending.size > 0 && Date.now() < deadline) {
+            if (!this.flushing) {
+                await this.flush();
+            } else {
+                await new Promise(resolve => setTimeout(resolve, 100));
+            }
+            if (onProgress) {
+                onProgress(total - this.pending.size, total);
+            }
+            if (this.failures > 0 && this.pending.size > 0) {
+                await new Promise(resolve => setTimeout(resolve, Math.min(this.maxBackoff, 1000 * this.failures)));
+            }
+        }
+        return this.pending.size;
+    }
+    
+    flushWithBeacon() {
+        if (this.pending.size === 0 || !navigator.sendBeacon) {
+            return;
+        }
+        // Les lignes restent dans IndexedDB : elles seront renvoyées au prochain chargement,
+        // le serveur ignorant les doublons.
+        let chunk = [];
+        const send = () => {
+            if (chunk.length > 0) {
+                const blob = new Blob([JSON.stringify({ results: chunk })], { type: 'application/json' });
+                navigator.sendBeacon(this.endpoint, blob);
+                chunk = [];
+            }
+        };
+        for (const row of this.pending.values()) {
+            chunk.push(row);
+            if (JSON.stringify({ results: chunk }).length > this.beaconMaxBytes) {
+                chunk.pop();
+                send();
+                chunk.push(row);
+            }
+        }
+        send();
+    }
+}
+
+// Rendu des stimuli sur canvas, calé sur les images de l'écran
+// Le stimulus est dessiné hors écran pendant la croix de fixation : pendant la fenêtre
+// d'exposition, il ne reste qu'une copie de l'image (pas de mise en page ni de recalcul de style).
+class StimulusRenderer {
+    constructor(canvas, styleSource) {
+        this.canvas = canvas;
+        this.styleSource = styleSource; // #stimulus-display : police et ombre reprises du CSS
+        this.context = canvas && canvas.getContext ? canvas.getContext('2d') : null;
+        this.buffer = document.createElement('canvas');
+        this.bufferContext = this.buffer.getContext ? this.buffer.getContext('2d') : null;
+        this.frameInterval = 1000 / 60;
+        this.frameSamples = 12;
+        
+        // ?render=dom pour revenir à l'ancien affichage par le DOM
+        const requested = new URLSearchParams(window.location.search).get('render');
+        this.enabled = !!(this.context && this.bufferContext && window.requestAnimationFrame) && requested !== 'dom';
+    }
+    
+    resize() {
+        const ratio = window.devicePixelRatio || 1;
+        const width = Math.round(window.innerWidth * ratio);
+        const height = Math.round(window.innerHeight * ratio);
+        // Redimensionner efface le canvas : uniquement si la fenêtre a changé
+        if (this.canvas.width !== width || this.canvas.height !== height) {
+            this.canvas.width = width;
+            this.canvas.height = height;
+        }
+        if (this.buffer.width !== width || this.buffer.height !== height) {
+            this.buffer.width = width;
+            this.buffer.height = height;
+        }
+        return ratio;
+    }
+    
+    // Durée d'une image (médiane des intervalles entre requestAnimationFrame)
+    measureFrameInterval() {
+        return new Promise(resolve => {
+            const deltas = [];
+            let last = null;
+            const tick = (timestamp) => {
+                if (last !== null) {
+                    deltas.push(timestamp - last);
+                }
+                last = timestamp;
+                if (deltas.length < this.frameSamples) {
+                    requestAnimationFrame(tick);
+                    return;
+                }
+                deltas.sort((a, b) => a - b);
+                this.frameInterval = deltas[Math.floor(deltas.length / 2)] || this.frameInterval;
+                resolve(this.frameInterval);
+            };
+            requestAnimationFrame(tick);
+        });
+    }
+    
+    fontFor(style) {
+        return `${style.fontStyle} ${style.fontWeight} ${style.fontSize} ${style.fontFamily}`;
+    }
+    
+    // "rgba(0, 0, 0, 0.3) 2px 2px 4px" -> {color, x, y, blur}
+    parseShadow(value) {
+        const match = /^(rgba?\([^)]*\)|#\w+|\w+)\s+(-?[\d.]+)px\s+(-?[\d.]+)px\s+([\d.]+)px/.exec(value || '');
+        if (!match) {
+            return null;
+        }
+        return {color: match[1], x: parseFloat(match[2]), y: parseFloat(match[3]), blur: parseFloat(match[4])};
+    }
+    
+    // Prépare l'image du prochain stimulus (appelé pendant la croix de fixation)
+    async prepare(trialData) {
+        const measuring = this.measureFrameInterval();
+        const style = window.getComputedStyle(this.styleSource);
+        const font = this.fontFor(style);
+        
+        // Les polices web doivent être prêtes, sinon le texte serait dessiné avec la police de secours
+        if (document.fonts) {
+            await document.fonts.ready;
+            await document.fonts.load(font, trialData.stimulus);
+        }
+        
+        const ratio = this.resize();
+        const width = this.buffer.width / ratio;
+        const height = this.buffer.height / ratio;
+        const ctx = this.bufferContext;
+        
+        ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
+        ctx.shadowColor = 'transparent';
+        ctx.fillStyle = trialData.background_color || '#ffffff';
+        ctx.fillRect(0, 0, width, height);
+        
+        const shadow = this.parseShadow(style.textShadow);
+        if (shadow) {
+            ctx.shadowColor = shadow.color;
+            ctx.shadowOffsetX = shadow.x * ratio;
+            ctx.shadowOffsetY = shadow.y * ratio;
+            ctx.shadowBlur = shadow.blur * ratio;
+        }
+        ctx.font = font;
+        ctx.fillStyle = trialData.text_color;
+        ctx.textAlign = 'center';
+        ctx.textBaseline = 'middle';
+        ctx.fillText(trialData.stimulus, width / 2, height / 2);
+        
+        // Vider le canvas visible et l'afficher maintenant, hors de la fenêtre d'exposition
+        this.context.clearRect(0, 0, this.canvas.width, this.canvas.height);
+        this.canvas.classList.add('ready');
+        await measuring;
+    }
+    
+    // Affiche l'image préparée pendant le nombre d'images correspondant à displayTime.
+    // Résout dans le rAF où l'image est effacée, avant le rendu de cette image.
+    present(displayTime) {
+        const frames = Math.max(1, Math.round(displayTime / this.frameInterval));
+        return new Promise(resolve => {
+            let count = 0;
+            let start = null;
+            const tick = (timestamp) => {
+                if (start === null) {
+                    start = timestamp;
+                    this.context.drawImage(this.buffer, 0, 0);
+                } else if (++count >= frames) {
+                    this.context.clearRect(0, 0, this.canvas.width, this.canvas.height);
+                    resolve({frames, duration: timestamp - start, frameInterval: this.frameInterval});
+                    return;
+                }
+                requestAnimationFrame(tick);
+            };
+            requestAnimationFrame(tick);
+        });
+    }
+    
+    clear() {
+        if (this.context) {
+            this.context.clearRect(0, 0, this.canvas.width, this.canvas.height);
+        }
+        if (this.canvas) {
+            this.canvas.classList.remove('ready');
+        }
+    }
+}
+
 class ExperimentApp {
     constructor() {
         this.currentScreen = 'welcome-screen';
@@ -21,6 +373,11 @@ class ExperimentApp {
         this.trialStartTime = null;
         this.results = [];
         this.currentBackgroundColor = '#ffffff';
+        this.resultQueue = new ResultQueue();
+        this.stimulusRenderer = new StimulusRenderer(
+            document.getElementById('stimulus-canvas'),
+            document.getElementById('stimulus-display')
+        );
         
         this.init();
     }
@@ -181,28 +538,55 @@ class ExperimentApp {
         
         console.log('🎯 Croix affichée - Container transparent');
         
+        // Récupérer et pré-dessiner le stimulus pendant la croix
+        const prepared = this.prepareTrial();
+        
         // Afficher croix pendant 1 seconde puis stimulus
         setTimeout(() => {
-            this.showStimulus();
+            this.showStimulus(prepared);
         }, 1000);
     }
     
-    async showStimulus() {
+    async prepareTrial() {
+        const response = await fetch('/get_trial', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                block_type: this.blockTypes[this.currentBlock],
+                trial_number: this.currentTrial
+            })
+        });
+        
+        const trialData = await response.json();
+        let onCanvas = false;
+        if (this.stimulusRenderer.enabled) {
+            try {
+                await this.stimulusRenderer.prepare(trialData);
+                onCanvas = true;
+            } catch (error) {
+                console.error('Rendu canvas indisponible, affichage DOM:', error);
+                this.stimulusRenderer.clear();
+            }
+        }
+        return {trialData, onCanvas};
+    }
+    
+    async showStimulus(prepared) {
         try {
-            const response = await fetch('/get_trial', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    block_type: this.blockTypes[this.currentBlock],
-                    trial_number: this.currentTrial
-                })
-            });
-            
-            const trialData = await response.json();
+            const {trialData, onCanvas} = await prepared;
             this.currentTrialData = trialData;
             
+            if (onCanvas) {
+                // Une seule copie d'image au début de la fenêtre, effacement après N images
+                const shown = await this.stimulusRenderer.present(trialData.display_time);
+                document.getElementById('fixation-cross').style.display = 'none';
+                console.log(`🖼️ Stimulus affiché ${shown.frames} image(s), ${shown.duration.toFixed(1)}ms (image ${shown.frameInterval.toFixed(1)}ms)`);
+                this.hideStimulus();
+                return;
+            }
+            
             // Cacher la croix
             document.getElementById('fixation-cross').style.display = 'none';
             
@@ -252,6 +636,7 @@ class ExperimentApp {
         // Cacher le stimulus
         const stimulusEl = document.getElementById('stimulus-display');
         stimulusEl.classList.remove('visible');
+        this.stimulusRenderer.clear();
         
         // TOUJOURS remettre le fond blanc après l'affichage du stimulus
         // Même pour le bloc 3, le fond coloré ne doit être visible que pendant les 50ms du stimulus
@@ -325,29 +710,21 @@ class ExperimentApp {
         const selectedChoice = this.currentTrialData.choices[choiceIndex];
         const isCorrect = selectedChoice === this.currentTrialData.stimulus;
         
-        // Envoyer la réponse au serveur
-        try {
-            await fetch('/submit_trial', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    trial_number: this.currentTrial,
-                    block_type: this.blockTypes[this.currentBlock],
-                    stimulus: this.currentTrialData.stimulus,
-                    response: selectedChoice,
-                    correct: isCorrect,
-                    reaction_time: reactionTime,
-                    text_color: this.currentTrialData.text_color,
-                    background_color: this.currentTrialData.background_color,
-                    is_word: this.currentTrialData.is_word,
-                    choices: this.currentTrialData.choices
-                })
-            });
-        } catch (error) {
-            console.error('Erreur lors de l\'envoi de la réponse:', error);
-        }
+        // Persister la réponse localement puis l'envoyer au serveur en arrière-plan
+        this.resultQueue.enqueue({
+            session_id: this.sessionId,
+            participant_id: this.participantId,
+            timestamp: new Date().toISOString(),
+            trial_number: this.currentTrial,
+            block_type: this.blockTypes[this.currentBlock],
+            stimulus: this.currentTrialData.stimulus,
+            response: selectedChoice,
+            correct: isCorrect,
+            reaction_time: reactionTime,
+            text_color: this.currentTrialData.text_color,
+            background_color: this.currentTrialData.background_color,
+            choices: this.currentTrialData.choices
+        });
         
         // Sauvegarder localement aussi avec toutes les données
         this.results.push({
@@ -494,6 +871,7 @@ class ExperimentApp {
         document.getElementById('trial-info').style.display = 'block';
         document.getElementById('fixation-cross').style.display = 'none';
         document.getElementById('stimulus-display').classList.remove('visible');
+        this.stimulusRenderer.clear();
         document.body.style.backgroundColor = '#ffffff';
         document.body.classList.remove('colored-background');
         document.body.style.removeProperty('--bg-color');
@@ -531,55 +909,22 @@ class ExperimentApp {
                 progressText.textContent = '0%';
             }
             
-            console.log('📤 Envoi des résultats:', this.results);
+            console.log('📤 Envoi des résultats restants:', this.resultQueue.pending.size);
             
-            // Envoyer tous les résultats stockés localement avec plus de détails
-            let successCount = 0;
-            const total = this.results.length || 0;
-            if (total === 0) {
+            // Les résultats sont envoyés au fil de l'eau : il ne reste qu'à vider la file d'attente
+            const total = this.results.length;
+            const remaining = await this.resultQueue.drain((sent, pendingTotal) => {
                 if (progressBar && progressText) {
-                    progressBar.style.width = '100%';
-                    progressText.textContent = '100%';
-                }
-            }
-            for (let i = 0; i < total; i++) {
-                const result = this.results[i];
-                try {
-                    const response = await fetch('/save_result', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({
-                            trial: result.trial,
-                            block: this.blockTypes[result.block],
-                            stimulus: result.stimulus,
-                            response: result.response,
-                            correct: result.correct,
-                            reactionTime: result.reactionTime,
-                            textColor: result.textColor || '#000000',
-                            backgroundColor: result.backgroundColor || '#ffffff',
-                            choices: result.choices || []
-                        })
-                    });
-                    
-                    const responseData = await response.json();
-                    if (responseData.success) {
-                        successCount++;
-                        console.log(`✅ Résultat ${successCount} envoyé avec succès`);
-                    } else {
-                        console.error('❌ Erreur serveur:', responseData.error);
-                    }
-                } catch (error) {
-                    console.error('❌ Erreur réseau:', error);
-                }
-                // Mettre à jour la progression
-                if (progressBar && progressText && total > 0) {
-                    const percent = Math.round(((i + 1) / total) * 100);
+                    const percent = pendingTotal > 0 ? Math.round((sent / pendingTotal) * 100) : 100;
                     progressBar.style.width = `${percent}%`;
                     progressText.textContent = `${percent}%`;
                 }
+            });
+            if (progressBar && progressText) {
+                progressBar.style.width = '100%';
+                progressText.textContent = '100%';
             }
+            const successCount = Math.max(0, total - remaining);
             
             // Succès
             btn.textContent = `✅ ${successCount}/${this.results.length} résultats envoyés !`;
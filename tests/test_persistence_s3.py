@@ -0,0 +1,160 @@
+"""Tests d'intégration du backend S3 contre un serveur compatible local (moto).
+
+Lancement : pip install -r requirements-dev.txt && python -m pytest tests
+"""
+import os
+import uuid
+
+import pytest
+
+moto_server = pytest.importorskip('moto.server')
+
+import persistence  # noqa: E402
+
+PART_SIZE = persistence.S3Backend.MIN_PART_SIZE
+
+
+@pytest.fixture(scope='module')
+def endpoint():
+    server = moto_server.ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f'http://{host}:{port}'
+    server.stop()
+
+
+@pytest.fixture
+def bucket(endpoint):
+    name = f'results-{uuid.uuid4().hex[:12]}'
+    assert make_backend(endpoint, name)._request('PUT', '').status_code == 200
+    return name
+
+
+def make_backend(endpoint, bucket, **kwargs):
+    """Nouvelle instance, comme dans un autre worker : cache d'ETag vide."""
+    return persistence.S3Backend(bucket, 'test', 'test', endpoint_url=endpoint, **kwargs)
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def test_single_part_push_then_append(endpoint, bucket, tmp_path):
+    backend = make_backend(endpoint, bucket)
+    local = write(tmp_path / 'results.csv', b'header\r\nrow1\r\n')
+    assert backend.push(local, 'data/results.csv', 'create')
+    assert backend.fetch('data/results.csv') == b'header\r\nrow1\r\n'
+
+    write(local, b'header\r\nrow1\r\nrow2\r\n')
+    assert backend.push(local, 'data/results.csv', 'append')  # If-Match sur l'ETag retenu
+    assert backend.fetch('data/results.csv') == b'header\r\nrow1\r\nrow2\r\n'
+
+
+def test_multipart_push(endpoint, bucket, tmp_path):
+    data = os.urandom(2 * PART_SIZE + 12345)
+    local = write(tmp_path / 'big.csv', data)
+    backend = make_backend(endpoint, bucket, part_size=PART_SIZE, workers=3)
+    assert backend.push(local, 'data/big.csv', 'multipart')
+    head = backend._request('HEAD', 'data/big.csv')
+    assert head.headers['ETag'].strip('"').endswith('-3')
+    assert backend.fetch('data/big.csv') == data
+
+    # Autre worker, fichier prolongé : l'ETag multipart n'est pas un MD5, l'objet est relu et comparé
+    write(local, data + b'tail')
+    assert make_backend(endpoint, bucket, part_size=PART_SIZE).push(local, 'data/big.csv', 'extend')
+    assert backend.fetch('data/big.csv') == data + b'tail'
+
+
+def test_first_push_of_a_worker_extends_existing_object(endpoint, bucket, tmp_path):
+    local = write(tmp_path / 'results.csv', b'header\r\nrow1\r\n')
+    assert make_backend(endpoint, bucket).push(local, 'data/results.csv', 'worker 1')
+
+    write(local, b'header\r\nrow1\r\nrow2\r\n')
+    assert make_backend(endpoint, bucket).push(local, 'data/results.csv', 'worker 2')
+    assert make_backend(endpoint, bucket).fetch('data/results.csv') == b'header\r\nrow1\r\nrow2\r\n'
+
+
+def test_stale_etag_412_retries_when_local_file_extends_remote(endpoint, bucket, tmp_path):
+    local = write(tmp_path / 'results.csv', b'header\r\n')
+    first = make_backend(endpoint, bucket)
+    assert first.push(local, 'data/results.csv', 'create')
+
+    write(local, b'header\r\nrow1\r\n')
+    assert make_backend(endpoint, bucket).push(local, 'data/results.csv', 'other worker')
+
+    # L'ETag retenu par `first` est obsolète : 412, relecture, le fichier local prolonge l'objet
+    write(local, b'header\r\nrow1\r\nrow2\r\n')
+    assert first.push(local, 'data/results.csv', 'stale worker')
+    assert first.fetch('data/results.csv') == b'header\r\nrow1\r\nrow2\r\n'
+
+
+def test_conflicting_remote_object_is_not_overwritten(endpoint, bucket, tmp_path):
+    backend = make_backend(endpoint, bucket)
+    assert backend.push(write(tmp_path / 'a.csv', b'header\r\nrow-from-a\r\n'), 'data/results.csv', 'instance a')
+
+    other = write(tmp_path / 'b.csv', b'header\r\nrow-from-b\r\nmore\r\n')
+    with pytest.raises(persistence.PersistenceConflict):
+        make_backend(endpoint, bucket).push(other, 'data/results.csv', 'instance b')
+    # Conflit détecté après un 412 (ETag retenu obsolète)
+    with pytest.raises(persistence.PersistenceConflict):
+        backend._forget('data/results.csv')
+        backend._remember('data/results.csv', '"0123456789abcdef0123456789abcdef"')
+        backend.push(other, 'data/results.csv', 'stale instance')
+    assert backend.fetch('data/results.csv') == b'header\r\nrow-from-a\r\n'
+
+
+def test_retention_rewrite_from_fresh_backend(endpoint, bucket, tmp_path):
+    local = write(tmp_path / 'results.csv', b'header\r\nold-session\r\nactive\r\n')
+    assert make_backend(endpoint, bucket).push(local, 'data/results.csv', 'before retention')
+
+    # La rétention retire les sessions archivées : le fichier ne prolonge plus l'objet distant
+    write(local, b'header\r\nactive\r\n')
+    with pytest.raises(persistence.PersistenceConflict):
+        make_backend(endpoint, bucket).push(local, 'data/results.csv', 'plain push')
+    fresh = make_backend(endpoint, bucket)
+    assert fresh.push(local, 'data/results.csv', 'Archive 1 completed sessions', rewrite=True)
+    assert fresh.fetch('data/results.csv') == b'header\r\nactive\r\n'
+
+    # Les ajouts suivants repartent de la version réécrite
+    write(local, b'header\r\nactive\r\nnew\r\n')
+    assert make_backend(endpoint, bucket).push(local, 'data/results.csv', 'append')
+
+
+def test_rewrite_with_stale_etag_retries_against_current_version(endpoint, bucket, tmp_path):
+    local = write(tmp_path / 'results.csv', b'header\r\nrow1\r\n')
+    stale = make_backend(endpoint, bucket)
+    assert stale.push(local, 'data/results.csv', 'create')
+    write(local, b'header\r\nrow1\r\nrow2\r\n')
+    assert make_backend(endpoint, bucket).push(local, 'data/results.csv', 'other worker')
+
+    write(local, b'header\r\n')
+    assert stale.push(local, 'data/results.csv', 'Repair results file', rewrite=True)
+    assert stale.fetch('data/results.csv') == b'header\r\n'
+
+
+def test_fetch_and_list_paths(endpoint, bucket, tmp_path):
+    backend = make_backend(endpoint, bucket, prefix='exp')
+    assert backend.fetch('data/results.csv') is None
+    local = write(tmp_path / 'part.csv.gz', b'\x1f\x8bpartition')
+    paths = [f'data/archive/date=2024-01-0{day}/block_type=bw/part-{day}.csv.gz' for day in (1, 2)]
+    for path in paths:
+        assert backend.push(local, path, 'archive')
+    assert backend.push(local, 'data/results.csv', 'hot')
+    assert sorted(backend.list_paths('data/archive/')) == paths
+    assert backend.list_paths('missing/') == []
+    assert backend.fetch(paths[0]) == b'\x1f\x8bpartition'
+
+
+def test_backend_is_recreated_after_fork(monkeypatch):
+    monkeypatch.setenv('PERSISTENCE_BACKEND', 's3')
+    monkeypatch.setenv('S3_BUCKET', 'results')
+    monkeypatch.setenv('S3_ACCESS_KEY_ID', 'test')
+    monkeypatch.setenv('S3_SECRET_ACCESS_KEY', 'test')
+    monkeypatch.setattr(persistence, '_BACKEND', None)
+    parent = persistence.get_backend()
+    assert persistence.get_backend() is parent
+    monkeypatch.setattr(os, 'getpid', lambda: -1)  # comme dans un worker forké
+    child = persistence.get_backend()
+    assert child is not parent and child.session is not parent.session
@@ -0,0 +1,69 @@
+"""Vérification incrémentale des sommes de contrôle et réparation du fichier de résultats."""
+import contextlib
+import csv
+
+import pytest
+
+import results_integrity
+import results_reader
+
+HEADER = ['session_id', 'timestamp', 'reaction_time']
+KEYS = ['session_id', 'timestamp']
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(results_integrity, 'CHUNK_BYTES', 512)
+    monkeypatch.setattr(results_reader, 'PARSE_WORKERS', 0)
+
+
+def append_rows(path, start, count):
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerows([f's{i}', f'2026-10-19T10:{i // 60 % 60:02d}:{i % 60:02d}', str(300 + i)]
+                                for i in range(start, start + count))
+    results_integrity.update_checksums(str(path))
+
+
+@pytest.fixture
+def results_file(tmp_path):
+    path = tmp_path / 'results.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        csv.writer(f).writerow(HEADER)
+    append_rows(path, 0, 200)
+    return str(path)
+
+
+def verify(path, **kwargs):
+    return results_integrity.verify(path, HEADER, KEYS, **kwargs)
+
+
+def test_quick_verify_only_checks_chunks_sealed_since_last_run(results_file):
+    first = verify(results_file)
+    assert first['ok'] and first['sealed_chunks'] > 5
+    assert first['crc_checked_chunks'] == first['sealed_chunks']
+    assert verify(results_file)['crc_checked_chunks'] == 0
+
+    append_rows(results_file, 200, 50)
+    report = verify(results_file)
+    assert report['ok'] and 0 < report['crc_checked_chunks'] < report['sealed_chunks']
+
+
+def test_full_crc_pass_is_opt_in(results_file):
+    verify(results_file)
+    # Octet altéré dans un morceau déjà contrôlé
+    chunk = results_integrity.load_checksums(results_file)[0]
+    with open(results_file, 'r+b') as f:
+        f.seek(chunk['start'])
+        f.write(b'X')
+    assert verify(results_file)['ok']
+    report = verify(results_file, all_chunks=True)
+    assert not report['ok'] and report['corrupted_count'] == 1
+    assert verify(results_file, full=True)['corrupted_count'] == 1
+
+
+def test_replaced_file_is_checked_again(results_file):
+    verify(results_file)
+    report = results_integrity.repair(results_file, HEADER, KEYS, contextlib.nullcontext)
+    assert report['rows'] == 200
+    after = verify(results_file)
+    assert after['ok'] and after['crc_checked_chunks'] == after['sealed_chunks'] > 0
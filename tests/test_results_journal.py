@@ -0,0 +1,119 @@
+"""Reprise du journal après un arrêt brutal : l'application des entrées est interrompue
+(apply_entry remplacé) puis replay() est appelé comme au redémarrage."""
+import os
+import time
+
+import pytest
+
+import results_journal
+
+
+@pytest.fixture
+def journal_dir(tmp_path):
+    return str(tmp_path / '.journal')
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def crash_before_apply(monkeypatch, operation, *args):
+    """Valide l'opération sans l'appliquer : arrêt juste après le point de validation."""
+    with monkeypatch.context() as patch:
+        patch.setattr(results_journal, 'apply_entry', lambda entry_path: None)
+        operation(*args)
+
+
+def pending(journal_dir):
+    return [name for name in os.listdir(journal_dir) if name.endswith(results_journal.PENDING_SUFFIX)]
+
+
+def test_interrupted_append_is_redone_from_its_offset(monkeypatch, journal_dir, tmp_path):
+    target = write(tmp_path / 'results.csv', b'header\r\nrow1\r\n')
+    crash_before_apply(monkeypatch, results_journal.append_file, journal_dir, target, b'row2\r\nrow3\r\n')
+    assert len(pending(journal_dir)) == 1
+    # Ajout à moitié écrit avant l'arrêt
+    with open(target, 'ab') as f:
+        f.write(b'row2\r\nro')
+
+    assert results_journal.replay(journal_dir) == 1
+    assert read(target) == b'header\r\nrow1\r\nrow2\r\nrow3\r\n'
+    assert pending(journal_dir) == []
+
+
+def test_segment_rename_is_applied_after_crash(monkeypatch, journal_dir, tmp_path):
+    target = write(tmp_path / 'results.csv', b'header\r\nold\r\n')
+    crash_before_apply(monkeypatch, results_journal.write_file, journal_dir, target, b'header\r\nnew\r\n')
+    assert read(target) == b'header\r\nold\r\n'
+
+    assert results_journal.replay(journal_dir) == 1
+    assert read(target) == b'header\r\nnew\r\n'
+    assert os.listdir(journal_dir) == []
+
+
+def test_partially_applied_transaction_completes(monkeypatch, journal_dir, tmp_path):
+    hot = write(tmp_path / 'results.csv', b'header\r\nold\r\nactive\r\n')
+    archive = str(tmp_path / 'archive' / 'date=2026-01-01' / 'part-1.csv.gz')
+    with monkeypatch.context() as patch:
+        patch.setattr(results_journal, 'apply_entry', lambda entry_path: None)
+        with results_journal.Transaction(journal_dir) as transaction:
+            archive_segment = transaction.segment(archive)
+            write(archive_segment, b'archived')
+            write(transaction.segment(hot), b'header\r\nactive\r\n')
+            transaction.commit()
+    # Arrêt après le premier renommage : archive en place, fichier chaud pas encore réécrit
+    os.makedirs(os.path.dirname(archive))
+    os.replace(archive_segment, archive)
+
+    assert results_journal.replay(journal_dir) == 1
+    assert read(archive) == b'archived'
+    assert read(hot) == b'header\r\nactive\r\n'
+
+
+def test_replay_is_idempotent(monkeypatch, journal_dir, tmp_path):
+    target = write(tmp_path / 'results.csv', b'header\r\n')
+    crash_before_apply(monkeypatch, results_journal.append_file, journal_dir, target, b'row1\r\n')
+    entry = os.path.join(journal_dir, pending(journal_dir)[0])
+    # Arrêt pendant apply_entry, avant la suppression de l'entrée : elle est rejouée
+    results_journal._apply_append(target, len(b'header\r\n'), b'row1\r\n')
+
+    assert results_journal.replay(journal_dir) == 1
+    assert not os.path.exists(entry)
+    assert results_journal.replay(journal_dir) == 0
+    assert read(target) == b'header\r\nrow1\r\n'
+
+
+def test_orphans_of_uncommitted_operations_are_removed_once_old(journal_dir, tmp_path):
+    target = str(tmp_path / 'results.csv')
+    transaction = results_journal.Transaction(journal_dir)
+    segment = write(transaction.segment(target), b'never committed')
+    tmp_entry = write(os.path.join(journal_dir, f'{transaction.id}.tmp'), b'{"id": "partial"')
+
+    # Une opération récente peut être en cours dans un autre processus : conservée
+    assert results_journal.replay(journal_dir) == 0
+    assert os.path.exists(segment) and os.path.exists(tmp_entry)
+
+    old = time.time() - results_journal.ORPHAN_SECONDS - 60
+    for path in (segment, tmp_entry):
+        os.utime(path, (old, old))
+    assert results_journal.replay(journal_dir) == 0
+    assert os.listdir(journal_dir) == []
+    assert not os.path.exists(target)
+
+
+def test_segments_of_pending_entries_are_not_treated_as_orphans(monkeypatch, journal_dir, tmp_path):
+    target = write(tmp_path / 'results.csv', b'old')
+    crash_before_apply(monkeypatch, results_journal.write_file, journal_dir, target, b'new')
+    old = time.time() - results_journal.ORPHAN_SECONDS - 60
+    for name in os.listdir(journal_dir):
+        os.utime(os.path.join(journal_dir, name), (old, old))
+
+    assert results_journal.replay(journal_dir) == 1
+    assert read(target) == b'new'
@@ -0,0 +1,86 @@
+"""Découpage en morceaux de results_reader comparé à csv.reader sur tout le fichier."""
+import csv
+import random
+
+import pytest
+
+import results_reader
+
+HEADER = ['session_id', 'stimulus', 'choices_presented', 'reaction_time']
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Morceaux de quelques centaines d'octets et pool dès le premier octet."""
+    monkeypatch.setattr(results_reader, 'CHUNK_BYTES', 256)
+    monkeypatch.setattr(results_reader, 'PARALLEL_MIN_BYTES', 0)
+    monkeypatch.setattr(results_reader, 'PARSE_WORKERS', 2)
+    monkeypatch.setattr(results_reader, 'SCAN_BYTES', 64)
+
+
+def tricky_rows(count, seed=7):
+    rng = random.Random(seed)
+    values = ['mot', 'a,b', 'ligne\nsuivante', 'dit "bonjour"', '""', 'fin\r\nde ligne', '', 'é|è|ê', '"\n"']
+    return [[f's{i}', rng.choice(values), '|'.join(rng.sample(values, 3)), str(rng.randint(200, 900))]
+            for i in range(count)]
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+    return str(path)
+
+
+def reference(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = [tuple(row) for row in csv.reader(f) if row]
+    return list(rows[0]), rows[1:]
+
+
+def test_split_offsets_fall_on_record_boundaries(small_chunks, tmp_path):
+    path = write_csv(tmp_path / 'results.csv', tricky_rows(300))
+    _, start = results_reader.read_header(path)
+    offsets = results_reader.split_offsets(path, start, 256)
+    assert len(offsets) > 10
+    expected_header, expected = reference(path)
+    parsed = []
+    for s, e in zip(offsets[:-1], offsets[1:]):
+        parsed.extend(results_reader.read_range(path, expected_header, s, e))
+    assert parsed == expected
+
+
+def test_read_rows_matches_csv_reader(small_chunks, tmp_path):
+    path = write_csv(tmp_path / 'results.csv', tricky_rows(500))
+    expected_header, expected = reference(path)
+    header, rows = results_reader.read_rows(path)
+    assert header == expected_header
+    assert rows == expected
+    assert results_reader.count_rows(path) == len(expected)
+
+
+def test_column_projection_and_streaming(small_chunks, tmp_path):
+    path = write_csv(tmp_path / 'results.csv', tricky_rows(400, seed=3))
+    _, expected = reference(path)
+    columns = ('reaction_time', 'session_id', 'absent')
+    _, rows = results_reader.read_rows(path, columns=columns)
+    assert rows == [(row[3], row[0], '') for row in expected]
+    streamed = results_reader.iter_rows(path, chunk_bytes=256)
+    assert next(streamed) == HEADER
+    assert list(streamed) == expected
+
+
+def test_incomplete_last_line_is_ignored(small_chunks, tmp_path):
+    path = write_csv(tmp_path / 'results.csv', tricky_rows(100))
+    _, expected = reference(path)
+    with open(path, 'ab') as f:
+        f.write(b's-partial,"mot,coup')  # écriture en cours, sans fin de ligne
+    _, rows = results_reader.read_rows(path)
+    assert rows == expected
+
+
+def test_sequential_path_matches(monkeypatch, tmp_path):
+    monkeypatch.setattr(results_reader, 'PARSE_WORKERS', 0)
+    path = write_csv(tmp_path / 'results.csv', tricky_rows(200, seed=11))
+    assert results_reader.read_rows(path)[1] == reference(path)[1]